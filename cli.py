@@ -3,7 +3,8 @@ import time
 
 from py9b.link.base import LinkTimeoutException
 from py9b.transport.base import BaseTransport as BT
-from py9b.command.regio import ReadRegs, WriteRegs
+from py9b.command.regio import ReadRegs, ReadPlan, WriteRegs
+from py9b.command.regmap import ESC_REGS, REGISTER_MAPS
 
 class Connection:
     def __init__(self, transport, link, address):
@@ -77,11 +78,12 @@ def dump(ctx, device):
         'extbms': BT.EXTBMS,
     }[device]
     with ctx.obj as tran:
-        for offset in range(256):
-            try:
-                print('0x%02x: %04x' % (offset, tran.execute(ReadRegs(dev, offset, "<H"))[0]))
-            except Exception as exc:
-                print('0x%02x: %s' % (offset, exc))
+        plan = ReadPlan(dev, [(offset, "<H") for offset in range(256)])
+        for offset, res in enumerate(plan.execute(tran, window=8)):
+            if isinstance(res, Exception):
+                print('0x%02x: %s' % (offset, res))
+            else:
+                print('0x%02x: %04x' % (offset, res[0]))
 
 @cli.command()
 @click.pass_context
@@ -123,40 +125,55 @@ def reboot(ctx):
         tran.execute(WriteRegs(BT.ESC, 0x78, "<H", 0x0001))
         print('Done')
 
-def print_reg(tran, desc, reg, format, dev=BT.ESC):
-    try:
-        data = tran.execute(ReadRegs(dev, reg, format))
-        print(desc % data)
-    except Exception as exc:
-        print(desc, repr(exc))
+def print_regs(regs, lines):
+    for desc, name, fmt in lines:
+        value = regs[name]
+        if isinstance(value, Exception):
+            print(desc, repr(value))
+        else:
+            print(desc + (fmt(value) if callable(fmt) else fmt % (value,)))
 
 def bms_info(tran, dev):
-    print('BMS S/N:         %s' % tran.execute(ReadRegs(dev, 0x10, "14s"))[0].decode())
-    print_reg(tran, 'BMS Version:     %04x', 0x17, "<H", dev=dev)
-    print_reg(tran, 'BMS charge:      %d%%', 0x32, "<H", dev=dev)
-    print_reg(tran, 'BMS full cycles: %d', 0x1b, "<H", dev=dev)
-    print_reg(tran, 'BMS charges:     %d', 0x1c, "<H", dev=dev)
-    print_reg(tran, 'BMS health:      %d%%', 0x3b, "<H", dev=dev)
-    print('BMS current:     %.2fA' % (tran.execute(ReadRegs(dev, 0x33, "<h"))[0] / 100.0,))
-    print('BMS voltage:     %.2fV' % (tran.execute(ReadRegs(dev, 0x34, "<h"))[0] / 100.0,))
+    regs = REGISTER_MAPS[dev].read(tran)
+    if isinstance(regs['serial'], Exception):
+        raise regs['serial']
+    print_regs(regs, [
+        ('BMS S/N:         ', 'serial', '%s'),
+        ('BMS Version:     ', 'version', '%04x'),
+        ('BMS charge:      ', 'charge', '%d%%'),
+        ('BMS full cycles: ', 'full_cycles', '%d'),
+        ('BMS charges:     ', 'charges', '%d'),
+        ('BMS health:      ', 'health', '%d%%'),
+        ('BMS current:     ', 'current', '%.2fA'),
+        ('BMS voltage:     ', 'voltage', '%.2fV'),
+    ])
 
 @cli.command()
 @click.pass_context
 def info(ctx):
     with ctx.obj as tran:
-        print('ESC S/N:       %s' % tran.execute(ReadRegs(BT.ESC, 0x10, "14s"))[0].decode())
-        print('ESC PIN:       %s' % tran.execute(ReadRegs(BT.ESC, 0x17, "6s"))[0].decode())
+        regs = ESC_REGS.read(tran)
+        print_regs(regs, [
+            ('ESC S/N:       ', 'serial', '%s'),
+            ('ESC PIN:       ', 'pin', '%s'),
+        ])
         print()
-        print_reg(tran, 'BLE Version:   %04x', 0x68, "<H")
-        print_reg(tran, 'ESC Version:   %04x', 0x1A, "<H")
+        print_regs(regs, [
+            ('BLE Version:   ', 'ble_version', '%04x'),
+            ('ESC Version:   ', 'version', '%04x'),
+        ])
         print()
-        print_reg(tran, 'Error code:    %d', 0x1B, "<H")
-        print_reg(tran, 'Warning code:  %d', 0x1C, "<H")
+        print_regs(regs, [
+            ('Error code:    ', 'error', '%d'),
+            ('Warning code:  ', 'warning', '%d'),
+        ])
         print()
-        print('Total mileage: %s' % pp_distance(tran.execute(ReadRegs(BT.ESC, 0x29, "<L"))[0]))
-        print('Total runtime: %s' % pp_time(tran.execute(ReadRegs(BT.ESC, 0x32, "<L"))[0]))
-        print('Total riding:  %s' % pp_time(tran.execute(ReadRegs(BT.ESC, 0x34, "<L"))[0]))
-        print('Chassis temp:  %d°C' % (tran.execute(ReadRegs(BT.ESC, 0x3e, "<H"))[0] / 10.0,))
+        print_regs(regs, [
+            ('Total mileage: ', 'total_mileage', pp_distance),
+            ('Total runtime: ', 'total_runtime', pp_time),
+            ('Total riding:  ', 'total_riding', pp_time),
+            ('Chassis temp:  ', 'chassis_temp', '%d°C'),
+        ])
         print()
 
         try:
@@ -0,0 +1,42 @@
+"""Frame decoder memory benchmark: decode 1M frames and keep every packet"""
+from __future__ import print_function
+import time
+import tracemalloc
+
+from py9b.transport.base import BaseTransport as BT
+from py9b.transport.packet import BasePacket
+from py9b.transport.ninebot import NinebotTransport, NinebotDecoder
+
+FRAMES = 1000000
+CHUNK = 0x1000
+
+
+class CaptureLink(object):
+    def __init__(self):
+        self.frames = []
+
+    def write(self, data):
+        self.frames.append(bytes(data))
+
+
+link = CaptureLink()
+tran = NinebotTransport(link)
+tran.send(BasePacket(BT.ESC, BT.HOST, 0x01, 0xB0, b"\x00" * 0x20))  # speed/current
+tran.send(BasePacket(BT.BMS, BT.HOST, 0x01, 0x31, b"\x00" * 0x0A))  # battery state
+stream = b"".join(link.frames) * (FRAMES // len(link.frames))
+
+dec = NinebotDecoder()
+packets = []
+tracemalloc.start()
+t0 = time.time()
+for ofs in range(0, len(stream), CHUNK):
+    packets.extend(dec.push(stream[ofs : ofs + CHUNK]))
+elapsed = time.time() - t0
+current, peak = tracemalloc.get_traced_memory()
+tracemalloc.stop()
+
+print("%d frames in %.2fs (%.0f frames/s)" % (len(packets), elapsed, len(packets) / elapsed))
+print(
+    "retained %.1f MiB (%.0f bytes/packet), peak %.1f MiB"
+    % (current / 1048576.0, float(current) / len(packets), peak / 1048576.0)
+)
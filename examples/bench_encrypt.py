@@ -0,0 +1,25 @@
+"""XiaomiTransport.encrypt benchmark: bulk integer XOR vs per-byte list comprehension"""
+from __future__ import print_function
+import os
+from timeit import timeit
+
+from py9b.transport.xiaomi import XiaomiDecoder
+
+ROUNDS = 100000
+
+
+def legacy_encrypt(keys, data):
+    k = keys
+    return bytearray([b ^ (k[i] if i < len(k) else 0) for i, b in enumerate(data)])
+
+
+dec = XiaomiDecoder(keys=bytearray(os.urandom(0x30)))
+for size in (9, 0x20, 0x87):  # register read, medium frame, firmware page
+    data = bytearray(os.urandom(size))
+    assert dec.encrypt(data) == legacy_encrypt(dec.keys, data)
+    old = timeit(lambda: legacy_encrypt(dec.keys, data), number=ROUNDS)
+    new = timeit(lambda: dec.encrypt(data), number=ROUNDS)
+    print(
+        "%3d bytes: legacy %.2fus, bulk %.2fus, speedup x%.1f"
+        % (size, old * 1e6 / ROUNDS, new * 1e6 / ROUNDS, old / new)
+    )
@@ -0,0 +1,34 @@
+"""Poll ESC and BMS registers at their own rates into a telemetry store"""
+from py9b.link.serial import SerialLink
+from py9b.transport.ninebot import NinebotTransport
+from py9b.command.regmap import ESC_REGS, BMS_REGS
+from py9b.poller import Poller
+from py9b.telemetry import TelemetryWriter
+
+link = SerialLink(buffered=True)
+# link = TCPLink()
+# link = BleakLink()
+
+with link:
+    print("Scanning...")
+    ports = link.scan()
+    print(ports)
+
+    tran = NinebotTransport(link)
+
+    link.open(ports[0][1])
+    print("Connected")
+
+    with TelemetryWriter("telemetry") as store:
+        poller = Poller(tran)
+        poller.add(ESC_REGS, ["error", "warning", "chassis_temp"], 1.0)
+        poller.add(BMS_REGS, ["current", "voltage"], 0.2)
+        poller.add(BMS_REGS, ["charge", "health"], 10.0, priority=1)
+        poller.add(ESC_REGS, ["total_mileage", "total_riding"], 60.0, priority=2)
+        poller.subscribe(store.add_sample)
+        try:
+            poller.run()
+        except KeyboardInterrupt:
+            pass
+        for group in poller.stats():
+            print(group["names"], group["polls"], "polls", group["missed"], "missed")
@@ -29,7 +29,7 @@ with link:
     hfo = open("BmsRegs.bin", "wb")
     for i in xrange(0x0, 0x100, READ_CHUNK_SIZE):
         print(".")
-        req.arg = i >> 1
+        req = req._replace(arg=i >> 1)
         for retry in xrange(5):
             tran.send(req)
             try:
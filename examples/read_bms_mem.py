@@ -1,4 +1,5 @@
 #!python2-32
+from __future__ import print_function
 from py9b.link.base import LinkOpenException, LinkTimeoutException
 from py9b.link.tcp import TCPLink
 from py9b.link.ble import BLELink
@@ -6,11 +7,10 @@ from py9b.link.serial import SerialLink
 from py9b.transport.base import BaseTransport as BT
 from py9b.transport.packet import BasePacket as PKT
 from py9b.transport.xiaomi import XiaomiTransport
-from py9b.command.custom import ReadMem
+from py9b.command.custom import MemoryDump
 
 ADDR = 0x1000
 SIZE = 0x800
-READ_CHUNK_SIZE = 0x10
 
 link = SerialLink(dump=True)
 # link = TCPLink()
@@ -27,19 +27,10 @@ with link:
     link.open(ports[0][1])
     print("Connected")
 
-    hfo = open("BmsEep.bin", "wb")
-    for i in xrange(ADDR, ADDR + SIZE, READ_CHUNK_SIZE):
-        print(".")
-        for retry in xrange(5):
-            try:
-                data = tran.execute(ReadMem(BT.BMS, i, "16s"))[0]
-            except LinkTimeoutException:
-                continue
-            break
-        else:
-            print("No response !")
-            break
-        hfo.write(data)
+    dump = MemoryDump(tran, BT.BMS, ADDR, SIZE, "BmsEep.bin")
+    try:
+        dump.run(lambda done, size: print("%d/%d" % (done, size)))
+    except LinkTimeoutException:
+        print("No response ! %d bytes read, run again to resume" % dump.done)
 
-    hfo.close()
     link.close()
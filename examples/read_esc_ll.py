@@ -29,7 +29,7 @@ with link:
     hfo = open("EscRegs.bin", "wb")
     for i in xrange(0, 0x200, READ_CHUNK_SIZE):
         print(".")
-        req.arg = i >> 1
+        req = req._replace(arg=i >> 1)
         for retry in xrange(3):
             tran.send(req)
             try:
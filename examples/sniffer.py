@@ -10,7 +10,7 @@ from py9b.transport.packet import BasePacket as PKT
 from py9b.transport.xiaomi import XiaomiTransport
 from py9b.transport.ninebot import NinebotTransport
 
-link = SerialLink()
+link = SerialLink(buffered=True, inter_byte_timeout=0.05)
 # link = TCPLink()
 # link = BLELink()
 
@@ -2,30 +2,164 @@ from __future__ import print_function
 from sys import argv, exit
 import os
 import argparse
+import json
 from progressbar import ProgressBar
 
 from py9b.link.base import LinkOpenException, LinkTimeoutException
 from py9b.transport.base import BaseTransport as BT
 from py9b.transport.xiaomi import XiaomiTransport
 from py9b.transport.ninebot import NinebotTransport
+from py9b.command.base import InvalidResponse
 from py9b.command.regio import ReadRegs, WriteRegs
 from py9b.command.update import *
 
 PING_RETRIES = 20
+# StartUpdate erases and FinishUpdate verifies the flash, neither is answered
+# in the time a register read takes nor is safe to send twice
+FLASH_TIMEOUT = 10.0
+MAX_WINDOW_FAILURES = 3  # in a row, before falling back to stop-and-wait
 
 
-def checksum(s, data):
-    for c in data:
-        s += c
-    return s & 0xFFFFFFFF
+def WritePages(tran, cmds, window, progress):
+    """Run WriteUpdate commands with up to window pages in flight.
 
+    Acks carry an error code in arg rather than the page, so they're matched
+    by order only. A window with a missing or rejected ack can't tell which
+    page failed: acks are drained for at least the response timeout, so
+    that a late one can't pass for an ack of the next window, and the window
+    is written again from its first page. A device that rejects pipelined pages (an UpdateError),
+    or fails MAX_WINDOW_FAILURES windows in a row, is written stop-and-wait
+    from there on.
+    """
+    i = 0
+    failures = 0
+    while i < len(cmds):
+        if window > 1:
+            batch = cmds[i : i + window]
+            errors = [
+                r for r in tran.execute_many(batch, window, retries=0)
+                if isinstance(r, Exception)
+            ]
+            if not errors:
+                failures = 0
+                i += len(batch)
+                progress(i)
+                continue
+            failures += 1
+            # a late ack would be counted for a page of the next window
+            tran.drain(commands=batch)
+            rejected = any(isinstance(e, UpdateError) for e in errors)
+            if not rejected and failures < MAX_WINDOW_FAILURES:
+                continue
+            print("\nWindowed write failed (%r), continuing stop-and-wait" % errors[0])
+            window = 1
+        tran.execute(cmds[i])
+        i += 1
+        progress(i)
 
-def UpdateFirmware(link, tran, dev, fwfile):
-    fwfile.seek(0, os.SEEK_END)
-    fw_size = fwfile.tell()
-    fwfile.seek(0)
-    fw_page_size = 0x80
 
+def LoadCheckpoint(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def SaveCheckpoint(path, state):
+    tmp = path + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp, path)
+
+
+def ResumeUpdate(tran, cmds, state):
+    """Tell if the device is still in update mode by writing the last acked
+    page again, resends of lost acks do the same"""
+    done = state["pages"]
+    if not done:
+        return False
+    try:
+        tran.execute(cmds[done - 1])
+    except (LinkTimeoutException, InvalidResponse, UpdateError) as e:
+        print("Device is not in update mode anymore (%r)" % e)
+        return False
+    return True
+
+
+def UpdateFirmware(link, tran, dev, fwfile, window=1, checkpoint=None, resume=False):
+    # TODO: Ninebot wants the last page padded. Will it work on M365 too?
+    with FirmwareImage(fwfile) as image:
+        # every frame is encoded before the transfer starts
+        cmds = image.commands(dev)
+        tran.pin_frames(cmd.request for cmd in cmds)
+        try:
+            if not WriteImage(tran, dev, image, cmds, window, checkpoint, resume):
+                return False
+        finally:
+            tran.unpin_frames()
+
+        print("Finalizing...")
+        tran.execute(
+            FinishUpdate(dev, image.checksum ^ 0xFFFFFFFF),
+            retries=0,
+            timeout=FLASH_TIMEOUT,
+        )
+    if checkpoint and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+
+    print("Reboot")
+    tran.execute(RebootUpdate(dev))
+    print("Done")
+    return True
+
+
+def WriteImage(tran, dev, image, cmds, window, checkpoint, resume):
+    """Start or resume the update and write every page"""
+    # the checkpoint records how many pages the device acked for this image
+    state = {
+        "image": image.sha256,
+        "device": dev,
+        "checksum": image.checksum,
+        "pages": 0,
+    }
+    done = 0
+    if resume and checkpoint:
+        saved = LoadCheckpoint(checkpoint)
+        if saved is None:
+            print("No checkpoint, starting over")
+        elif any(saved.get(k) != state[k] for k in ("image", "device", "checksum")):
+            print("Checkpoint is for another image or device, starting over")
+        else:
+            print("Resuming at page %d of %d..." % (saved["pages"], len(cmds)))
+            if ResumeUpdate(tran, cmds, saved):
+                done = saved["pages"]
+
+    if not done:
+        if not StartDeviceUpdate(tran, dev, image.size):
+            return False
+
+    print("Writing...")
+    pb = ProgressBar(maxval=len(cmds) + 1).start()
+
+    def progress(n):
+        nonlocal checkpoint
+        pb.update(done + n)
+        if checkpoint:
+            state["pages"] = done + n
+            try:
+                SaveCheckpoint(checkpoint, state)
+            except (IOError, OSError) as e:
+                # the device is mid-update, losing the checkpoint is better
+                print("\nCan't save checkpoint (%s), continuing without" % e)
+                checkpoint = None
+
+    WritePages(tran, cmds[done:], window, progress)
+    pb.finish()
+    return True
+
+
+def StartDeviceUpdate(tran, dev, fw_size):
     print("Pinging...", end="")
     for retry in range(PING_RETRIES):
         print(".", end="")
@@ -49,31 +183,7 @@ def UpdateFirmware(link, tran, dev, fwfile):
         print("Not Locking...")
 
     print("Starting...")
-    tran.execute(StartUpdate(dev, fw_size))
-
-    print("Writing...")
-    pb = ProgressBar(maxval=fw_size // fw_page_size + 1).start()
-    page = 0
-    chk = 0
-    while fw_size:
-        pb.update(page)
-        chunk_sz = min(fw_size, fw_page_size)
-        data = fwfile.read(chunk_sz)
-        chk = checksum(chk, data)
-        # tran.execute(WriteUpdate(dev, page, data))
-        tran.execute(
-            WriteUpdate(dev, page, data + b"\x00" * (fw_page_size - chunk_sz))
-        )  # TODO: Ninebot wants this padding. Will it work on M365 too?
-        page += 1
-        fw_size -= chunk_sz
-    pb.finish()
-
-    print("Finalizing...")
-    tran.execute(FinishUpdate(dev, chk ^ 0xFFFFFFFF))
-
-    print("Reboot")
-    tran.execute(RebootUpdate(dev))
-    print("Done")
+    tran.execute(StartUpdate(dev, fw_size), retries=0, timeout=FLASH_TIMEOUT)
     return True
 
 
@@ -118,6 +228,29 @@ parser.add_argument(
     default="xiaomi",
 )
 
+parser.add_argument(
+    "-w",
+    "--window",
+    help="firmware pages in flight, 1 waits for every ack, default: %(default)s",
+    type=int,
+    default=1,
+)
+
+parser.add_argument(
+    "-r",
+    "--resume",
+    help="continue an interrupted update from the checkpoint file it kept (with -c"
+    " or -r)",
+    action="store_true",
+)
+
+parser.add_argument(
+    "-c",
+    "--checkpoint",
+    help="keep a checkpoint file to resume from, default with -r: firmware file"
+    " name + .checkpoint",
+)
+
 if len(argv) == 1:
     parser.print_usage()
     exit()
@@ -173,7 +306,16 @@ with link:
     link.open(addr)
     print("Connected")
     try:
-        UpdateFirmware(link, tran, dev, args.file)
+        UpdateFirmware(
+            link,
+            tran,
+            dev,
+            args.file,
+            max(args.window, 1),
+            args.checkpoint
+            or (args.file.name + ".checkpoint" if args.resume else None),
+            args.resume,
+        )
     except Exception as e:
         print("Error:", e)
         raise
@@ -11,6 +11,11 @@ class BaseCommand(object):
         self.has_response = has_response
         self.request = PKT(src, dst, cmd, arg, data)
 
+    def match(self, response):
+        """Tell if response answers this command's request: it has to come
+        from the device the request went to and be addressed to its sender"""
+        return response.src == self.request.dst and response.dst == self.request.src
+
     def handle_response(self, response):
         self.has_response = True
         return True
@@ -1,5 +1,9 @@
+import json
+import mmap
+import os
 from struct import pack, unpack, calcsize
 from .base import BaseCommand, InvalidResponse
+from ..link.base import LinkTimeoutException
 
 
 class ReadMem(BaseCommand):
@@ -14,6 +18,9 @@ class ReadMem(BaseCommand):
         self.dev = dev
         self.format = format
 
+    def match(self, response):
+        return super(ReadMem, self).match(response) and response.cmd == 0x80
+
     def handle_response(self, response):
         if len(response.data) != calcsize(self.format):
             raise InvalidResponse("ReadMem {0:X}".format(self.dev))
@@ -21,4 +28,154 @@ class ReadMem(BaseCommand):
         self.has_response=True
 
 
-__all__ = ["ReadMem"]
+class MemoryDump(object):
+    """Dumps size bytes of dev memory from addr into path with ReadMem.
+
+    The chunk size is probed (the largest of CHUNK_SIZES the device answers)
+    unless given, window reads are kept in flight and every chunk is written
+    straight into the memory mapped, preallocated output. Completed ranges are
+    kept in path + ".ranges" so that an interrupted dump run again with the
+    same parameters only reads what's missing, the sidecar is removed when
+    the dump completes.
+
+    ReadMem responses don't carry the address, they're told apart by order
+    only. A window in which any read failed is thrown away as a whole and,
+    after draining late responses, read again. Repeated failures halve the
+    chunk size, a run of clean windows grows it back.
+    """
+
+    CHUNK_SIZES = (0x80, 0x40, 0x20, 0x10)
+    MIN_CHUNK_SIZE = 0x08
+    MAX_FAILURES = 8  # consecutive failed windows
+    REGROW_AFTER = 8  # clean windows before a halved chunk size doubles again
+
+    def __init__(self, transport, dev, addr, size, path, window=4, chunk_size=None):
+        if size <= 0 or addr + size > 0x10000:
+            raise ValueError("Bad memory range %X+%X" % (addr, size))
+        self.transport = transport
+        self.dev = dev
+        self.addr = addr
+        self.size = size
+        self.path = path
+        self.window = window
+        self.chunk_size = chunk_size
+        self.ranges = []  # completed [start, end) offsets, sorted, merged
+
+    @property
+    def sidecar(self):
+        return self.path + ".ranges"
+
+    @property
+    def done(self):
+        return sum(end - start for start, end in self.ranges)
+
+    def probe_chunk_size(self):
+        for size in self.CHUNK_SIZES:
+            size = min(size, self.size)
+            cmd = ReadMem(self.dev, self.addr, "%ds" % size)
+            try:
+                self.transport.execute(cmd)
+            except (LinkTimeoutException, InvalidResponse):
+                self.transport.drain(commands=[cmd])
+                continue
+            return size
+        raise LinkTimeoutException()
+
+    def _load(self):
+        try:
+            with open(self.sidecar) as f:
+                state = json.load(f)
+        except (IOError, OSError, ValueError):
+            return
+        if (
+            state.get("addr") == self.addr
+            and state.get("size") == self.size
+            and os.path.getsize(self.path) == self.size
+        ):
+            self.ranges = [tuple(r) for r in state["ranges"]]
+
+    def _save(self):
+        tmp = self.sidecar + ".tmp"
+        with open(tmp, "w") as f:
+            json.dump({"addr": self.addr, "size": self.size, "ranges": self.ranges}, f)
+        os.replace(tmp, self.sidecar)
+
+    def _add_range(self, start, end):
+        ranges = []
+        for s, e in self.ranges:
+            if e < start or s > end:
+                ranges.append((s, e))
+            else:
+                start, end = min(s, start), max(e, end)
+        ranges.append((start, end))
+        ranges.sort()
+        self.ranges = ranges
+
+    def _chunks(self, start, end, chunk_size):
+        return [(ofs, min(chunk_size, end - ofs)) for ofs in range(start, end, chunk_size)]
+
+    def pending(self, chunk_size):
+        """(offset, size) reads still needed"""
+        res = []
+        pos = 0
+        for start, end in self.ranges + [(self.size, self.size)]:
+            res += self._chunks(pos, start, chunk_size)
+            pos = end
+        return res
+
+    def run(self, progress=None):
+        """Dump, calling progress(done, size) after every window"""
+        if os.path.exists(self.path):
+            self._load()
+        mode = "r+b" if self.ranges else "w+b"
+        with open(self.path, mode) as f:
+            f.truncate(self.size)
+            mm = mmap.mmap(f.fileno(), self.size)
+            try:
+                self._run(mm, progress)
+            finally:
+                mm.flush()
+                mm.close()
+        os.remove(self.sidecar)
+
+    def _run(self, mm, progress):
+        if self.chunk_size is None:
+            self.chunk_size = self.probe_chunk_size()
+        max_chunk = self.chunk_size
+        todo = self.pending(self.chunk_size)
+        failures = successes = 0
+        while todo:
+            batch, todo = todo[: self.window], todo[self.window :]
+            cmds = [
+                ReadMem(self.dev, self.addr + ofs, "%ds" % size) for ofs, size in batch
+            ]
+            results = self.transport.execute_many(cmds, self.window, retries=0)
+            errors = [r for r in results if isinstance(r, Exception)]
+            if errors:
+                failures += 1
+                successes = 0
+                if failures >= self.MAX_FAILURES:
+                    self._save()
+                    raise errors[0]
+                # responses are matched by order, a late one must not make it
+                # into the next window
+                self.transport.drain(commands=cmds)
+                if failures % 2 == 0 and self.chunk_size > self.MIN_CHUNK_SIZE:
+                    self.chunk_size //= 2
+                todo = self.pending(self.chunk_size)
+                continue
+            failures = 0
+            for (ofs, size), res in zip(batch, results):
+                mm[ofs : ofs + size] = res[0]
+                self._add_range(ofs, ofs + size)
+            self._save()
+            if progress:
+                progress(self.done, self.size)
+            successes += 1
+            if successes >= self.REGROW_AFTER and self.chunk_size < max_chunk:
+                self.chunk_size *= 2
+                successes = 0
+                todo = self.pending(self.chunk_size)
+
+
+__all__ = ["ReadMem", "MemoryDump"]
@@ -1,33 +1,108 @@
 """Register read/write commands"""
 
-from struct import pack, unpack, calcsize
+from struct import Struct, pack, unpack
 from .base import BaseCommand, InvalidResponse
 
 
 class ReadRegs(BaseCommand):
     def __init__(self, dev, reg, format):
+        self._struct = format if isinstance(format, Struct) else Struct(format)
         super(ReadRegs, self).__init__(
             dst=dev,
             cmd=0x01,
             arg=reg,
-            data=pack("<B", calcsize(format)),
+            data=pack("<B", self._struct.size),
             has_response=False,
         )
         self.dev = dev
         self.reg = reg
-        self.format = format
+        self.format = self._struct.format
+
+    def match(self, response):
+        return (
+            super(ReadRegs, self).match(response)
+            and response.cmd in (0x01, 0x04)  # xiaomi, ninebot
+            and response.arg == self.reg
+        )
 
     def handle_response(self, response):
-        if response.arg != self.reg or len(response.data) != calcsize(self.format):
+        if response.arg != self.reg or len(response.data) != self._struct.size:
             raise InvalidResponse(
                 "ReadRegs {0:X}:{1:X}: @{2:X} [{3:X}]".format(
                     self.dev, self.reg, response.arg, len(response.data)
                 )
             )
-        return unpack(self.format, response.data)
+        return self._struct.unpack(response.data)
         self.has_response=True
 
 
+class ReadPlan(object):
+    """Coalesces single register reads into as few block reads as possible.
+
+    requests is a sequence of (reg, format) or of objects with reg, size and
+    unpack_from(data, offset) like regmap.Register. Registers are 16 bit
+    wide, so reg covers bytes reg*2 onwards. Requests closer than max_gap
+    bytes are merged into one ReadRegs of at most max_size bytes, the gaps
+    are read and thrown away. unpack() maps the block results back to the
+    requests.
+    """
+
+    DEF_MAX_SIZE = 0x20
+    DEF_MAX_GAP = 0x08
+
+    def __init__(self, dev, requests, max_size=DEF_MAX_SIZE, max_gap=DEF_MAX_GAP):
+        self.dev = dev
+        self.requests = list(requests)
+        self.commands = []
+        # (reg, size, unpack_from) per request
+        fields = []
+        for req in self.requests:
+            if isinstance(req, tuple):
+                st = Struct(req[1])
+                fields.append((req[0], st.size, st.unpack_from))
+            else:
+                fields.append((req.reg, req.size, req.unpack_from))
+        self._slices = [None] * len(fields)  # (block, offset, unpack_from)
+
+        blocks = []  # [start, end, [request indexes]] in bytes
+        order = sorted(range(len(fields)), key=lambda i: fields[i][0])
+        for i in order:
+            reg, size, _ = fields[i]
+            start = reg * 2
+            end = start + size
+            if blocks:
+                block = blocks[-1]
+                if (
+                    start - block[1] <= max_gap
+                    and max(end, block[1]) - block[0] <= max_size
+                ):
+                    block[1] = max(end, block[1])
+                    block[2].append(i)
+                    continue
+            blocks.append([start, end, [i]])
+
+        for n, (start, end, members) in enumerate(blocks):
+            self.commands.append(ReadRegs(dev, start >> 1, "%ds" % (end - start)))
+            for i in members:
+                reg, _, unpack_from = fields[i]
+                self._slices[i] = (n, reg * 2 - start, unpack_from)
+
+    def unpack(self, results):
+        """Turn the results of self.commands into one per request: the unpacked
+        value, or the exception its block failed with"""
+        res = []
+        for n, offset, unpack_from in self._slices:
+            block = results[n]
+            if isinstance(block, Exception):
+                res.append(block)
+            else:
+                res.append(unpack_from(block[0], offset))
+        return res
+
+    def execute(self, transport, window=4):
+        return self.unpack(transport.execute_many(self.commands, window))
+
+
 class WriteProtectError(Exception):
     pass
 
@@ -40,6 +115,9 @@ class WriteRegs(BaseCommand):
         self.dev = dev
         self.reg = reg
 
+    def match(self, response):
+        return super(WriteRegs, self).match(response) and response.cmd in (0x02, 0x05)
+
     def handle_response(self, response):
         if response.cmd == 0x02:  # xiaomi style
             if response.arg != self.reg or len(response.data) != 1:
@@ -76,4 +154,4 @@ class WriteRegs(BaseCommand):
         self.has_response=True
 
 
-__all__ = ["ReadRegs", "WriteRegs", "WriteProtectError"]
+__all__ = ["ReadRegs", "ReadPlan", "WriteRegs", "WriteProtectError"]
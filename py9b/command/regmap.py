@@ -0,0 +1,144 @@
+"""Register maps of ESC, BMS and BLE"""
+
+from struct import Struct
+from ..transport.base import BaseTransport as BT
+from .regio import ReadPlan
+
+
+class Register(object):
+    """One named register: address, struct format and conversion.
+
+    Single field formats decode to a scalar, strings have their NUL padding
+    stripped, scale multiplies numeric values (0.01 turns centiamps into
+    amps). ttl is how long a RegisterShadow may serve a read value, STATIC
+    for identity registers that don't change while connected.
+    """
+
+    STATIC = float("inf")
+
+    __slots__ = (
+        "name", "reg", "format", "scale", "unit", "ttl", "size", "_struct", "_convert"
+    )
+
+    def __init__(self, name, reg, format, scale=None, unit="", ttl=0.0):
+        self.name = name
+        self.reg = reg
+        self.format = format
+        self.scale = scale
+        self.unit = unit
+        self.ttl = ttl
+        self._struct = Struct(format)
+        self.size = self._struct.size
+        fields = len(self._struct.unpack(bytes(self.size)))
+        if fields == 1 and format.endswith("s"):
+            self._convert = lambda v: v[0].rstrip(b"\x00").decode("utf-8", "replace")
+        elif fields > 1:
+            self._convert = tuple if scale is None else (lambda v: tuple(x * scale for x in v))
+        elif scale is None:
+            self._convert = lambda v: v[0]
+        else:
+            self._convert = lambda v: v[0] * scale
+
+    def unpack_from(self, data, offset=0):
+        return self._convert(self._struct.unpack_from(data, offset))
+
+    def __repr__(self):
+        return "Register(%r, 0x%02X, %r)" % (self.name, self.reg, self.format)
+
+
+class RegisterMap(object):
+    """Registers of one device, readable by name with coalesced block reads"""
+
+    def __init__(self, dev, registers):
+        self.dev = dev
+        self.registers = dict((r.name, r) for r in registers)
+        self._plans = {}  # names tuple: ReadPlan
+
+    def __getitem__(self, name):
+        return self.registers[name]
+
+    def __contains__(self, name):
+        return name in self.registers
+
+    def __iter__(self):
+        return iter(self.registers)
+
+    def plan(self, names=None, max_size=ReadPlan.DEF_MAX_SIZE, max_gap=ReadPlan.DEF_MAX_GAP):
+        names = tuple(self.registers) if names is None else tuple(names)
+        key = (names, max_size, max_gap)
+        plan = self._plans.get(key)
+        if plan is None:
+            plan = self._plans[key] = ReadPlan(
+                self.dev, [self.registers[n] for n in names], max_size, max_gap
+            )
+        return plan
+
+    def read(self, transport, names=None, window=4):
+        """Read registers (all by default), return {name: value}. A register
+        whose block read failed maps to the exception."""
+        plan = self.plan(names)
+        names = [r.name for r in plan.requests]
+        return dict(zip(names, plan.execute(transport, window)))
+
+
+_STATIC = Register.STATIC
+
+
+def _esc_registers():
+    return [
+        Register("serial", 0x10, "14s", ttl=_STATIC),
+        Register("pin", 0x17, "6s", ttl=_STATIC),
+        Register("version", 0x1A, "<H", ttl=_STATIC),
+        Register("error", 0x1B, "<H"),
+        Register("warning", 0x1C, "<H"),
+        Register("total_mileage", 0x29, "<L", unit="m"),
+        Register("total_runtime", 0x32, "<L", unit="s"),
+        Register("total_riding", 0x34, "<L", unit="s"),
+        Register("chassis_temp", 0x3E, "<H", 0.1, "C"),
+        Register("ble_version", 0x68, "<H", ttl=_STATIC),
+        Register("uid3", 0xDE, "<L", ttl=_STATIC),
+    ]
+
+
+def _bms_registers():
+    return [
+        Register("serial", 0x10, "14s", ttl=_STATIC),
+        Register("version", 0x17, "<H", ttl=_STATIC),
+        Register("full_cycles", 0x1B, "<H"),
+        Register("charges", 0x1C, "<H"),
+        Register("charge", 0x32, "<H", unit="%"),
+        Register("current", 0x33, "<h", 0.01, "A"),
+        Register("voltage", 0x34, "<h", 0.01, "V"),
+        Register("health", 0x3B, "<H", unit="%"),
+        Register("uid3", 0xDE, "<L", ttl=_STATIC),
+    ]
+
+
+def _ble_registers():
+    return [
+        Register("version", 0x68, "<H", ttl=_STATIC),
+    ]
+
+
+ESC_REGS = RegisterMap(BT.ESC, _esc_registers())
+BMS_REGS = RegisterMap(BT.BMS, _bms_registers())
+EXTBMS_REGS = RegisterMap(BT.EXTBMS, _bms_registers())
+BLE_REGS = RegisterMap(BT.BLE, _ble_registers())
+
+REGISTER_MAPS = {
+    BT.ESC: ESC_REGS,
+    BT.BMS: BMS_REGS,
+    BT.EXTBMS: EXTBMS_REGS,
+    BT.BLE: BLE_REGS,
+}
+
+
+__all__ = [
+    "Register",
+    "RegisterMap",
+    "ESC_REGS",
+    "BMS_REGS",
+    "EXTBMS_REGS",
+    "BLE_REGS",
+    "REGISTER_MAPS",
+]
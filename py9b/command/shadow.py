@@ -0,0 +1,111 @@
+"""Cached copy of device registers"""
+
+import time
+from threading import Lock
+from .regio import WriteRegs
+from ..subscribers import Subscribers
+
+
+_STALE = float("-inf")  # stamp of invalidated values, older than any ttl
+
+
+class RegisterShadow(object):
+    """Last known register values, served while younger than their ttl.
+
+    Attaches to transport: every WriteRegs sent through it, by any execute
+    variant, marks the cached registers overlapping the written range stale.
+    Stale values are read again but kept to tell if they changed. Writes
+    by other commands (WriteSNAuth, firmware updates) need an explicit
+    invalidate(). Subscribers get callback(dev, name, old, new) for every
+    read value that differs from the cached one, old is None the first time.
+    """
+
+    def __init__(self, transport, window=4):
+        self.transport = transport
+        self.window = window
+        self._values = {}  # (dev, name): (value, stamp, start, end) in bytes
+        self._subscribers = Subscribers()
+        self._lock = Lock()
+        transport.shadow = self
+
+    def detach(self):
+        if self.transport.shadow is self:
+            self.transport.shadow = None
+
+    def subscribe(self, callback):
+        return self._subscribers.add(callback)
+
+    def unsubscribe(self, callback):
+        self._subscribers.remove(callback)
+
+    def get(self, regmap, name, default=None):
+        """Cached value of name regardless of its age"""
+        entry = self._values.get((regmap.dev, name))
+        return default if entry is None else entry[0]
+
+    def stale(self, regmap, names, now=None):
+        """Those of names that have to be read from the device"""
+        if now is None:
+            now = time.time()
+        values = self._values
+        res = []
+        for name in names:
+            entry = values.get((regmap.dev, name))
+            if entry is None or now - entry[1] >= regmap[name].ttl:
+                res.append(name)
+        return res
+
+    def update(self, regmap, values, stamp=None):
+        """Store freshly read {name: value}, return the names that changed.
+        Exceptions in place of values are skipped."""
+        if stamp is None:
+            stamp = time.time()
+        dev = regmap.dev
+        changed = []
+        with self._lock:
+            for name, value in values.items():
+                if isinstance(value, Exception):
+                    continue
+                reg = regmap[name]
+                old = self._values.get((dev, name))
+                self._values[(dev, name)] = (
+                    value, stamp, reg.reg * 2, reg.reg * 2 + reg.size
+                )
+                if old is None or old[0] != value:
+                    changed.append((name, None if old is None else old[0], value))
+        for name, old, new in changed:
+            self._subscribers.notify(dev, name, old, new)
+        return [name for name, _, _ in changed]
+
+    def read(self, regmap, names=None):
+        """Like RegisterMap.read(), reading only registers past their ttl"""
+        names = list(regmap) if names is None else list(names)
+        with self._lock:
+            stale = self.stale(regmap, names)
+            res = dict(
+                (name, self._values[(regmap.dev, name)][0])
+                for name in names
+                if name not in stale
+            )
+        if stale:
+            values = regmap.read(self.transport, stale, self.window)
+            self.update(regmap, values)
+            res.update(values)
+        return res
+
+    def invalidate(self, dev=None, start=None, size=None):
+        """Mark cached registers of dev (all devices if None) overlapping
+        size bytes from byte offset start (the whole device if None) stale"""
+        with self._lock:
+            for key, entry in list(self._values.items()):
+                if dev is not None and key[0] != dev:
+                    continue
+                if start is None or (entry[2] < start + size and start < entry[3]):
+                    self._values[key] = (entry[0], _STALE) + entry[2:]
+
+    def sent(self, command):
+        if isinstance(command, WriteRegs):
+            self.invalidate(command.dev, command.reg * 2, len(command.request.data))
+
+
+__all__ = ["RegisterShadow"]
@@ -1,5 +1,7 @@
 """Firmware update commands"""
 
+import hashlib
+import mmap
 from struct import pack, unpack
 from .base import BaseCommand, InvalidResponse
 
@@ -28,7 +30,17 @@ class UpdateError(Exception):
     pass
 
 
-class StartUpdate(BaseCommand):
+class _UpdateCommand(BaseCommand):
+    """Update commands are answered with the request's cmd"""
+
+    def match(self, response):
+        return (
+            super(_UpdateCommand, self).match(response)
+            and response.cmd == self.request.cmd
+        )
+
+
+class StartUpdate(_UpdateCommand):
     def __init__(self, dev, size):
         super(StartUpdate, self).__init__(
             dst=dev, cmd=0x07, data=pack("<L", size), has_response=False
@@ -48,7 +60,7 @@ class StartUpdate(BaseCommand):
         self.has_response=True
 
 
-class WriteUpdate(BaseCommand):
+class WriteUpdate(_UpdateCommand):
     def __init__(self, dev, page, data):
         super(WriteUpdate, self).__init__(
             dst=dev, cmd=0x08, arg=page & 0xFF, data=data, has_response=False
@@ -73,7 +85,7 @@ class WriteUpdate(BaseCommand):
         self.has_response=True
 
 
-class FinishUpdate(BaseCommand):
+class FinishUpdate(_UpdateCommand):
     def __init__(self, dev, checksum):
         super(FinishUpdate, self).__init__(
             dst=dev, cmd=0x09, data=pack("<L", checksum), has_response=False
@@ -93,7 +105,7 @@ class FinishUpdate(BaseCommand):
         self.has_response=True
 
 
-class RebootUpdate(BaseCommand):
+class RebootUpdate(_UpdateCommand):
     def __init__(self, dev):
         super(RebootUpdate, self).__init__(dst=dev, cmd=0x0A, has_response=False)
         self.dev = dev
@@ -103,4 +115,66 @@ class RebootUpdate(BaseCommand):
         self.has_response=True
 
 
-__all__ = ["UpdateError", "StartUpdate", "WriteUpdate", "FinishUpdate", "RebootUpdate"]
+class FirmwareImage(object):
+    """Firmware file split into update pages.
+
+    The file is memory mapped and pages are memoryviews into it, only the
+    last one is copied to pad it to page_size. checksum is what FinishUpdate
+    expects before the final inversion, sha256 identifies the image.
+    """
+
+    PAGE_SIZE = 0x80
+
+    def __init__(self, fwfile, page_size=PAGE_SIZE):
+        self.page_size = page_size
+        self._map = None
+        try:
+            self._map = mmap.mmap(fwfile.fileno(), 0, access=mmap.ACCESS_READ)
+            view = memoryview(self._map)
+        except (AttributeError, IOError, OSError, ValueError):
+            # not a real file (or an empty one)
+            fwfile.seek(0)
+            view = memoryview(fwfile.read())
+        self.size = len(view)
+        if not self.size:
+            raise ValueError("Empty firmware image")
+        self.checksum = sum(view) & 0xFFFFFFFF
+        self.sha256 = hashlib.sha256(view).hexdigest()
+
+        last = (self.size - 1) // page_size * page_size
+        self.pages = [view[ofs : ofs + page_size] for ofs in range(0, last, page_size)]
+        tail = view[last:].tobytes()
+        self.pages.append(memoryview(tail + b"\x00" * (page_size - len(tail))))
+        self._view = view
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __len__(self):
+        return len(self.pages)
+
+    def commands(self, dev):
+        """WriteUpdate command for every page"""
+        return [WriteUpdate(dev, page, data) for page, data in enumerate(self.pages)]
+
+    def close(self):
+        for page in self.pages:
+            page.release()
+        self.pages = []
+        self._view.release()
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+
+
+__all__ = [
+    "UpdateError",
+    "StartUpdate",
+    "WriteUpdate",
+    "FinishUpdate",
+    "RebootUpdate",
+    "FirmwareImage",
+]
@@ -1,3 +1,6 @@
+import asyncio
+
+
 class LinkTimeoutException(Exception):
     pass
 
@@ -9,10 +12,19 @@ class LinkOpenException(Exception):
 class BaseLink(object):
     DEF_TIMEOUT = 1
 
+    # traffic counters, links bump them in read*/write*
+    bytes_in = 0
+    bytes_out = 0
+
+    _pending_read = None  # executor read_available() outliving its caller
+
     def __init__(self, timeout=DEF_TIMEOUT, dump=False):
         self.dump = dump
         self.timeout = timeout
 
+    def stats(self):
+        return {"bytes_in": self.bytes_in, "bytes_out": self.bytes_out}
+
     def scan(self):
         raise NotImplementedError()
 
@@ -25,8 +37,43 @@ class BaseLink(object):
     def read(self, size):
         raise NotImplementedError()
 
+    def read_available(self, timeout=None):
+        """Return all bytes received so far, waiting for at least one up to
+        timeout seconds (None for the link's timeout)"""
+        return self.read(1)
+
     def write(self, data):
         raise NotImplementedError()
 
+    # Coroutine variants, links without native asyncio support run the
+    # blocking calls in the loop's default executor
+
+    async def open_async(self, port):
+        await asyncio.get_event_loop().run_in_executor(None, self.open, port)
+
+    async def close_async(self):
+        await asyncio.get_event_loop().run_in_executor(None, self.close)
+
+    async def read_async(self, size):
+        return await asyncio.get_event_loop().run_in_executor(None, self.read, size)
+
+    async def read_available_async(self):
+        # cancelling the caller (a timed out attempt) can't stop the blocking
+        # read: the next call takes over its result instead of racing it for
+        # the same bytes
+        fut = self._pending_read
+        if fut is None:
+            fut = self._pending_read = asyncio.ensure_future(
+                asyncio.get_event_loop().run_in_executor(None, self.read_available)
+            )
+        try:
+            return await asyncio.shield(fut)
+        finally:
+            if fut.done():
+                self._pending_read = None
+
+    async def write_async(self, data):
+        await asyncio.get_event_loop().run_in_executor(None, self.write, data)
+
 
 __all__ = ["LinkTimeoutException", "LinkOpenException", "BaseLink"]
@@ -2,34 +2,14 @@
 
 from __future__ import absolute_import
 import pygatt
-from .base import BaseLink, LinkTimeoutException, LinkOpenException
+from .base import BaseLink, LinkOpenException
+from .fifo import Fifo
 from binascii import hexlify
 from threading import Event
 
 SCAN_TIMEOUT = 3
 
 
-try:
-    import queue
-except ImportError:
-    import Queue as queue
-
-
-class Fifo:
-    def __init__(self):
-        self.q = queue.Queue()
-
-    def write(self, data):  # put bytes
-        for b in data:
-            self.q.put(b)
-
-    def read(self, size=1, timeout=None):  # but read string
-        res = ""
-        for i in xrange(size):
-            res += chr(self.q.get(True, timeout))
-        return res
-
-
 # _cccd_uuid = '00002902-0000-1000-8000-00805f9b34fb'
 _rx_char_uuid = "6e400002-b5a3-f393-e0a9-e50e24dcca9e"
 _tx_char_uuid = "6e400003-b5a3-f393-e0a9-e50e24dcca9e"
@@ -39,11 +19,13 @@ _write_chunk_size = 20  # as in android dumps
 
 class BLELink(BaseLink):
     def __init__(self, *args, **kwargs):
+        rx_capacity = kwargs.pop("rx_capacity", Fifo.DEF_CAPACITY)
+        rx_overflow = kwargs.pop("rx_overflow", Fifo.DROP_OLDEST)
         super(BLELink, self).__init__(*args, **kwargs)
         self._adapter = None
         self._dev = None
         self._wr_handle = None
-        self._rx_fifo = Fifo()
+        self._rx_fifo = Fifo(rx_capacity, rx_overflow)
         self.scanned = Event()
         self.connected = Event()
         self.iotimeout = 2
@@ -97,11 +79,23 @@ class BLELink(BaseLink):
             if self.connected.is_set():
                 self.connected.clear()
 
+    def stats(self):
+        res = super(BLELink, self).stats()
+        res["rx_dropped"] = self._rx_fifo.dropped
+        return res
+
     def read(self, size):
-        try:
-            data = self._rx_fifo.read(size, timeout=self.iotimeout)
-        except queue.Empty:
-            raise LinkTimeoutException
+        data = self._rx_fifo.read(size, timeout=self.iotimeout)
+        self.bytes_in += size
+        if self.dump:
+            print("<", hexlify(data).upper())
+        return data
+
+    def read_available(self, timeout=None):
+        data = self._rx_fifo.read_available(
+            timeout=self.iotimeout if timeout is None else timeout
+        )
+        self.bytes_in += len(data)
         if self.dump:
             print("<", hexlify(data).upper())
         return data
@@ -118,6 +112,7 @@ class BLELink(BaseLink):
             )
             ofs += chunk_sz
             size -= chunk_sz
+        self.bytes_out += len(data)
 
 
 __all__ = ["BLELink"]
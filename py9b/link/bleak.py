@@ -2,6 +2,7 @@ import asyncio
 
 from bleak import discover, BleakClient
 from py9b.link.base import BaseLink, LinkTimeoutException
+from py9b.link.fifo import Fifo
 from threading import Thread
 from threading import Event
 
@@ -17,28 +18,9 @@ _manuf_data_xiaomi_pro =  [34, 1, 0, 0, 0, 220]
 _manuf_data_ninebot_max = [36, 2, 0, 0, 0, 217]
 _manuf_data_ninebot_max555 = [36, 0, 0, 0, 0, 219]
 
-_write_chunk_size = 20  # as in android dumps
-
-try:
-    import queue
-except ImportError:
-    import Queue as queue
-
-
-class Fifo:
-    def __init__(self):
-        self.q = queue.Queue()
-
-    def write(self, data):  # put bytes
-        for b in data:
-            self.q.put(b)
-
-    def read(self, size=1, timeout=None):  # but read string
-        res = bytearray()
-        for i in range(size):
-            res.append(self.q.get(True, timeout))
-        return res
-
+_write_chunk_size = 20  # as in android dumps, fallback when MTU is unknown
+_max_write_chunk_size = 512  # ATT attribute value limit
+_write_timeout = 3
 
 def run_worker(loop):
     print("Starting event loop", loop)
@@ -46,19 +28,33 @@ def run_worker(loop):
     loop.run_forever()
 
 
-_write_chunk_size = 20
-
-
 class BLELink(BaseLink):
-    def __init__(self, device="hci0", loop=None, *args, **kwargs):
+    def __init__(
+        self,
+        device="hci0",
+        loop=None,
+        rx_capacity=Fifo.DEF_CAPACITY,
+        rx_overflow=Fifo.DROP_OLDEST,
+        chunk_size=None,
+        write_response=None,
+        *args,
+        **kwargs
+    ):
         self.adapter = device
         self.timeout = 2
         self.loop = loop or asyncio.get_event_loop()
-        self._rx_fifo = Fifo()
+        self._rx_fifo = Fifo(rx_capacity, rx_overflow)
         self.device = None
         self._th = None
         self.scanned = Event()
         self.connected = Event()
+        self._rx_event = None  # set by open_async()
+        # chunk_size=None follows the negotiated MTU, write_response=None
+        # uses write-without-response when the characteristic allows it
+        self._chunk_size_opt = chunk_size
+        self._write_response_opt = write_response
+        self.chunk_size = chunk_size or _write_chunk_size
+        self.write_response = True if write_response is None else write_response
 
     def __enter__(self):
         self.start()
@@ -96,6 +92,10 @@ class BLELink(BaseLink):
             discover(timeout=timeout, device=self.adapter), self.loop
         )
 
+        return self._filter_devices(devices)
+
+    @staticmethod
+    def _filter_devices(devices):
         return [
             (dev.name, dev.address)
             for dev in devices
@@ -116,35 +116,140 @@ class BLELink(BaseLink):
         print("connected")
         self.connected.set()
         await self.device.start_notify(_tx_char_uuid, self._data_received)
-        print("services:", list(await self.device.get_services()))
+        services = await self.device.get_services()
+        print("services:", list(services))
+        self._setup_writes(services)
+
+    def _setup_writes(self, services):
+        char = None
+        if hasattr(services, "get_characteristic"):
+            char = services.get_characteristic(_rx_char_uuid)
+        no_rsp = char is not None and "write-without-response" in char.properties
+        if self._write_response_opt is None:
+            self.write_response = not no_rsp
+        else:
+            self.write_response = self._write_response_opt
+
+        if self._chunk_size_opt:
+            self.chunk_size = self._chunk_size_opt
+            return
+        size = getattr(char, "max_write_without_response_size", None)
+        if not size or self.write_response:
+            mtu = getattr(self.device, "mtu_size", None)
+            size = mtu - 3 if mtu else _write_chunk_size
+        self.chunk_size = max(_write_chunk_size, min(size, _max_write_chunk_size))
 
     def _data_received(self, sender, data):
         self._rx_fifo.write(data)
+        if self._rx_event is not None:
+            self._rx_event.set()
+
+    async def _write_frame(self, data):
+        # Without write_response the chunks are queued back to back and only
+        # the last one is acknowledged, which keeps at most one frame in
+        # flight and gives the stack a point to apply back pressure
+        data = bytes(data)
+        size = self.chunk_size
+        last = max(len(data) - size, 0)
+        for ofs in range(0, len(data), size):
+            await self.device.write_gatt_char(
+                _rx_char_uuid,
+                data[ofs : ofs + size],
+                self.write_response or ofs >= last,
+            )
 
     def write(self, data):
-        size = len(data)
-        ofs = 0
-        while size:
-            chunk_sz = min(size, _write_chunk_size)
-            self._write_chunk(bytearray(data[ofs : ofs + chunk_sz]))
-            ofs += chunk_sz
-            size -= chunk_sz
-
-    def _write_chunk(self, data):
-        fut = asyncio.run_coroutine_threadsafe(
-            self.device.write_gatt_char(_rx_char_uuid, bytearray(data), True),
-            self.loop,
-        )
-        return fut.result(3)
+        # the whole frame is a single hand-off to the event loop thread
+        fut = asyncio.run_coroutine_threadsafe(self._write_frame(data), self.loop)
+        chunks = (len(data) + self.chunk_size - 1) // self.chunk_size
+        fut.result(_write_timeout * (chunks if self.write_response else 1))
+        self.bytes_out += len(data)
+
+    def stats(self):
+        res = super(BLELink, self).stats()
+        res["rx_dropped"] = self._rx_fifo.dropped
+        return res
 
     def read(self, size):
-        try:
-            data = self._rx_fifo.read(size, timeout=self.timeout)
-        except queue.Empty:
-            raise LinkTimeoutException
+        data = self._rx_fifo.read(size, timeout=self.timeout)
+        self.bytes_in += size
+        return data
+
+    def read_available(self, timeout=None):
+        data = self._rx_fifo.read_available(
+            timeout=self.timeout if timeout is None else timeout
+        )
+        self.bytes_in += len(data)
         return data
 
     def fetch_keys(self):
         return asyncio.run_coroutine_threadsafe(
             self.device.read_gatt_char(_keys_char_uuid), self.loop
         ).result(5)
+
+    # Native coroutine API: connects and talks to the device on the caller's
+    # event loop, without the worker thread
+
+    async def scan_async(self, timeout=1):
+        devices = await discover(timeout=timeout, device=self.adapter)
+        self.scanned.set()
+        return self._filter_devices(devices)
+
+    async def open_async(self, port):
+        self.loop = asyncio.get_event_loop()
+        self._rx_event = asyncio.Event()
+        await self._connect(port)
+
+    async def close_async(self):
+        await self.device.disconnect()
+        self._rx_event = None
+        if self.scanned.is_set():
+            self.scanned.clear()
+        if self.connected.is_set():
+            self.connected.clear()
+
+    async def _wait_rx(self):
+        try:
+            await asyncio.wait_for(self._rx_event.wait(), self.timeout)
+        except asyncio.TimeoutError:
+            raise LinkTimeoutException
+        self._rx_event.clear()
+
+    async def read_async(self, size):
+        if self._rx_event is None:
+            # opened with open(), notifications arrive on the worker thread
+            return await super(BLELink, self).read_async(size)
+        res = bytearray()
+        while True:
+            # single consumer, whatever is buffered is there to take
+            n = min(size - len(res), len(self._rx_fifo))
+            if n:
+                res += self._rx_fifo.read(n, timeout=0)
+            if len(res) == size:
+                self.bytes_in += size
+                return res
+            await self._wait_rx()
+
+    async def read_available_async(self):
+        if self._rx_event is None:
+            return await super(BLELink, self).read_available_async()
+        while True:
+            try:
+                data = self._rx_fifo.read_available(timeout=0)
+            except LinkTimeoutException:
+                await self._wait_rx()
+                continue
+            self.bytes_in += len(data)
+            return data
+
+    async def write_async(self, data):
+        await self._write_frame(data)
+        self.bytes_out += len(data)
+
+    async def fetch_keys_async(self):
+        return await self.device.read_gatt_char(_keys_char_uuid)
+
+
+BleakLink = BLELink
+
+__all__ = ["BLELink", "BleakLink"]
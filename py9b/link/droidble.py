@@ -7,19 +7,15 @@ try:
 except ImportError:
     exit("error importing able")
 try:
-    from .base import BaseLink, LinkTimeoutException, LinkOpenException
+    from .base import BaseLink, LinkOpenException
 except ImportError:
     exit("error importing .base")
+from .fifo import Fifo
 from binascii import hexlify
 from kivy.logger import Logger
 from kivy.clock import mainthread
 from kivy.properties import StringProperty
 
-try:
-    import queue
-except ImportError:
-    import Queue as queue
-
 from threading import Event
 
 try:
@@ -79,26 +75,11 @@ key_ids = {
 SCAN_TIMEOUT = 3
 _write_chunk_size = 20
 
-class Fifo:
-    def __init__(self):
-        self.q = queue.Queue()
-
-    def write(self, data):  # put bytes
-        for b in data:
-            self.q.put(b)
-
-    def read(self, size=1, timeout=None):  # but read string
-        res = bytearray()
-        for i in range(size):
-            res.append(self.q.get(True, timeout))
-        return res
-
-
 class BLELink(BaseLink, BluetoothDispatcher):
-    def __init__(self):
+    def __init__(self, rx_capacity=Fifo.DEF_CAPACITY, rx_overflow=Fifo.DROP_OLDEST):
         super(BLELink, self).__init__()
         BluetoothDispatcher.__init__(self)
-        self.rx_fifo = Fifo()
+        self.rx_fifo = Fifo(rx_capacity, rx_overflow)
         self.addr = ''
         self.device = None
         self.device_list = []
@@ -229,12 +210,25 @@ class BLELink(BaseLink, BluetoothDispatcher):
         except:
             print(self.state)
 
+    def stats(self):
+        res = super(BLELink, self).stats()
+        res["rx_dropped"] = self.rx_fifo.dropped
+        return res
+
     def read(self, size):
         if self.device and self.connected.is_set():
-            try:
-                data = self.rx_fifo.read(size, timeout=self.iotimeout)
-            except queue.Empty:
-                raise LinkTimeoutException
+            data = self.rx_fifo.read(size, timeout=self.iotimeout)
+            self.bytes_in += size
+            if self.dump:
+                print("<", hexlify(data).upper())
+            return data
+
+    def read_available(self, timeout=None):
+        if self.device and self.connected.is_set():
+            data = self.rx_fifo.read_available(
+                timeout=self.iotimeout if timeout is None else timeout
+            )
+            self.bytes_in += len(data)
             if self.dump:
                 print("<", hexlify(data).upper())
             return data
@@ -252,6 +246,7 @@ class BLELink(BaseLink, BluetoothDispatcher):
                 )
                 ofs += chunk_sz
                 size -= chunk_sz
+            self.bytes_out += len(data)
 
     def scan(self):
         self.discover(self.timeout)
@@ -97,6 +97,7 @@ class SerialLink(BaseLink):
             raise LinkTimeoutException
         if len(data) < size:
             raise LinkTimeoutException
+        self.bytes_in += size
         if self.dump:
             print("<", hexlify(data).upper())
         return data
@@ -105,6 +106,7 @@ class SerialLink(BaseLink):
         if self.dump:
             print(">", hexlify(data).upper())
         self.device.write(data)
+        self.bytes_out += len(data)
 
 
 __all__ = ["SerialLink"]
@@ -0,0 +1,106 @@
+"""Bounded receive FIFO for notification based links"""
+
+import time
+from threading import Condition
+from .base import LinkTimeoutException
+
+
+class Fifo(object):
+    """Byte ring buffer filled by a receive callback and drained by link reads.
+
+    All state is guarded by a single condition variable, writes and reads move
+    whole chunks. When a write doesn't fit, DROP_OLDEST discards the oldest
+    buffered bytes (a sniffer keeps the most recent traffic) and DROP_NEWEST
+    the incoming ones. Dropped bytes are counted in self.dropped.
+    """
+
+    DEF_CAPACITY = 0x10000
+    DROP_OLDEST = "oldest"
+    DROP_NEWEST = "newest"
+
+    def __init__(self, capacity=DEF_CAPACITY, overflow=DROP_OLDEST):
+        if overflow not in (Fifo.DROP_OLDEST, Fifo.DROP_NEWEST):
+            raise ValueError("Unknown overflow policy: %r" % (overflow,))
+        self.capacity = capacity
+        self.overflow = overflow
+        self.dropped = 0
+        self._buf = bytearray(capacity)
+        self._head = 0  # read position
+        self._size = 0
+        self._cond = Condition()
+
+    def __len__(self):
+        return self._size
+
+    def write(self, data):
+        data = memoryview(bytearray(data) if isinstance(data, list) else data)
+        size = len(data)
+        capacity = self.capacity
+        with self._cond:
+            excess = self._size + size - capacity
+            if excess > 0:
+                self.dropped += excess
+                if self.overflow == Fifo.DROP_NEWEST:
+                    size -= excess
+                    data = data[:size]
+                elif excess > self._size:
+                    # the chunk alone doesn't fit, keep its tail
+                    data = data[excess - self._size :]
+                    size = capacity
+                    self._head = self._size = 0
+                else:
+                    self._head = (self._head + excess) % capacity
+                    self._size -= excess
+            if not size:
+                return
+            tail = (self._head + self._size) % capacity
+            first = min(size, capacity - tail)
+            self._buf[tail : tail + first] = data[:first]
+            if first < size:
+                self._buf[: size - first] = data[first:]
+            self._size += size
+            self._cond.notify_all()
+
+    def _wait(self, size, timeout):
+        if self._size >= size:
+            return
+        deadline = None if timeout is None else time.time() + timeout
+        while self._size < size:
+            if deadline is None:
+                self._cond.wait()
+                continue
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                raise LinkTimeoutException
+            self._cond.wait(remaining)
+
+    def _take(self, size):
+        head = self._head
+        end = head + size
+        if end <= self.capacity:
+            res = self._buf[head:end]
+        else:
+            res = self._buf[head:] + self._buf[: end - self.capacity]
+        self._head = end % self.capacity
+        self._size -= size
+        return res
+
+    def read(self, size=1, timeout=None):
+        """Return exactly size bytes, raise LinkTimeoutException if they don't
+        arrive within timeout seconds (None waits forever)"""
+        with self._cond:
+            self._wait(size, timeout)
+            return self._take(size)
+
+    def read_available(self, timeout=None):
+        """Return everything buffered, waiting up to timeout for the first byte"""
+        with self._cond:
+            self._wait(1, timeout)
+            return self._take(self._size)
+
+    def clear(self):
+        with self._cond:
+            self._head = self._size = 0
+
+
+__all__ = ["Fifo"]
@@ -3,16 +3,26 @@
 from __future__ import absolute_import
 import serial
 import serial.tools.list_ports as lp
+import time
 from binascii import hexlify
 from .base import BaseLink, LinkTimeoutException, LinkOpenException
 from threading import Event
 
 
 class SerialLink(BaseLink):
+    DEF_BAUDRATE = 115200
+    POLL_TIMEOUT = 0.02  # port timeout, longer waits take several
+
     def __init__(self, *args, **kwargs):
+        # buffered=True drains in_waiting into a read-ahead buffer and, once a
+        # read has started receiving, waits inter_byte_timeout (default:
+        # timeout) for each further byte instead of a whole timeout per call
+        self.baudrate = kwargs.pop("baudrate", SerialLink.DEF_BAUDRATE)
+        self.inter_byte_timeout = kwargs.pop("inter_byte_timeout", None)
+        self.buffered = kwargs.pop("buffered", False)
         super(SerialLink, self).__init__(*args, **kwargs)
         self.device = None
-        self.timeout = 1
+        self._rx = bytearray()
         self.scanned = Event()
         self.connected = Event()
 
@@ -35,10 +45,11 @@ class SerialLink(BaseLink):
         try:
             self.device = serial.Serial(
                 port,
-                115200,
+                self.baudrate,
                 parity=serial.PARITY_NONE,
                 stopbits=serial.STOPBITS_ONE,
-                timeout=self.timeout,
+                timeout=SerialLink.POLL_TIMEOUT,
+                inter_byte_timeout=self.inter_byte_timeout,
             )
             self.connected.set()
         except serial.SerialException:
@@ -52,22 +63,73 @@ class SerialLink(BaseLink):
                 self.connected.clear()
             self.device.close()
             self.device = None
+            del self._rx[:]
 
-    def read(self, size):
-        try:
-            data = self.device.read(size)
-        except serial.SerialTimeoutException:
-            raise LinkTimeoutException
-        if len(data) < size:
+    def _poll(self, size, deadline):
+        # the port timeout stays POLL_TIMEOUT: pyserial reconfigures the port
+        # on every change of it, so waits loop here until deadline instead
+        while True:
+            try:
+                data = self.device.read(size)
+            except serial.SerialTimeoutException:
+                data = b""
+            if data or time.time() >= deadline:
+                return data
+
+    def _fill(self, timeout):
+        # one call takes whatever the driver has queued, blocking only when
+        # it's empty
+        data = self._poll(max(self.device.in_waiting, 1), time.time() + timeout)
+        if not data:
             raise LinkTimeoutException
+        self._rx += data
+
+    def _take(self, size):
+        data = bytes(self._rx[:size])
+        del self._rx[:size]
+        return data
+
+    def _read(self, size, timeout):
+        deadline = time.time() + timeout
+        data = bytearray()
+        while len(data) < size:
+            chunk = self._poll(size - len(data), deadline)
+            if not chunk:
+                raise LinkTimeoutException
+            data += chunk
+        return bytes(data)
+
+    def _received(self, data):
+        self.bytes_in += len(data)
         if self.dump:
             print("<", hexlify(data).upper())
         return data
 
+    def read(self, size):
+        if not self.buffered:
+            return self._received(self._read(size, self.timeout))
+        timeout = self.timeout
+        while len(self._rx) < size:
+            self._fill(timeout)
+            timeout = self.inter_byte_timeout or self.timeout
+        return self._received(self._take(size))
+
+    def read_available(self, timeout=None):
+        if timeout is None:
+            timeout = self.timeout
+        if not self.buffered:
+            return self._received(self._read(max(self.device.in_waiting, 1), timeout))
+        if not self._rx:
+            self._fill(timeout)
+        elif self.device.in_waiting:
+            self._fill(0)
+        return self._received(self._take(len(self._rx)))
+
     def write(self, data):
         if self.dump:
             print(">", hexlify(data).upper())
         self.device.write(data)
+        self.bytes_out += len(data)
 
 
 __all__ = ["SerialLink"]
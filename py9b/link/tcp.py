@@ -1,5 +1,6 @@
 """TCP-BLE bridge link"""
 from __future__ import absolute_import
+import asyncio
 import socket
 from binascii import hexlify
 from .base import BaseLink, LinkTimeoutException, LinkOpenException
@@ -8,27 +9,24 @@ from threading import Event
 HOST, PORT = "127.0.0.1", 6000
 
 _write_chunk_size = 20  # 20 as in android dumps
-
-
-def recvall(sock, size):
-    data = ""
-    while len(data) < size:
-        try:
-            pkt = sock.recv(size - len(data))
-        except socket.timeout:
-            raise LinkTimeoutException()
-        data += pkt
-    return data
+_recv_size = 4096
 
 
 class TCPLink(BaseLink):
     def __init__(self, *args, **kwargs):
+        # frames go out in one sendall, chunk_size=_write_chunk_size restores
+        # the BLE sized writes for bridges that don't split frames themselves
+        self.chunk_size = kwargs.pop("chunk_size", None)
         super(TCPLink, self).__init__(*args, **kwargs)
         self.device = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.device.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
         self.timeout = 2
         self.device.settimeout(self.timeout)
+        self._sock_timeout = self.timeout
+        self._rx = bytearray()  # read-ahead, filled in _recv_size blocks
         self.scanned = Event()
         self.connected = Event()
+        self._reader = self._writer = None  # set by open_async()
 
     def __enter__(self):
         return self
@@ -60,22 +58,96 @@ class TCPLink(BaseLink):
             if self.connected.is_set():
                 self.connected.clear()
 
-    def read(self, size):
-        data = recvall(self.device, size)
-        if data and self.dump:
+    def _fill(self, timeout):
+        if timeout != self._sock_timeout:
+            self.device.settimeout(timeout)
+            self._sock_timeout = timeout
+        try:
+            pkt = self.device.recv(_recv_size)
+        except socket.timeout:
+            raise LinkTimeoutException()
+        if not pkt:
+            raise EOFError("TCP bridge closed the connection")
+        self._rx += pkt
+
+    def _take(self, size):
+        data = bytes(self._rx[:size])
+        del self._rx[:size]
+        self.bytes_in += size
+        if self.dump:
             print("<", hexlify(data).upper())
         return data
 
+    def read(self, size):
+        while len(self._rx) < size:
+            self._fill(self.timeout)
+        return self._take(size)
+
+    def read_available(self, timeout=None):
+        if not self._rx:
+            self._fill(self.timeout if timeout is None else timeout)
+        return self._take(len(self._rx))
+
     def write(self, data):
         if self.dump:
             print(">", hexlify(data).upper())
-        size = len(data)
-        ofs = 0
-        while size:
-            chunk_sz = min(size, _write_chunk_size)
-            self.device.sendall(data[ofs : ofs + chunk_sz])
-            ofs += chunk_sz
-            size -= chunk_sz
+        if not self.chunk_size:
+            self.device.sendall(data)
+        else:
+            for ofs in range(0, len(data), self.chunk_size):
+                self.device.sendall(data[ofs : ofs + self.chunk_size])
+        self.bytes_out += len(data)
+
+    # Native coroutine API on asyncio streams, independent from the socket above
+
+    async def open_async(self, port):
+        p = port.partition(":")
+        try:
+            self._reader, self._writer = await asyncio.wait_for(
+                asyncio.open_connection(p[0], int(p[2], 10)), self.timeout
+            )
+        except (asyncio.TimeoutError, OSError):
+            raise LinkOpenException
+        self.connected.set()
+
+    async def close_async(self):
+        if self._writer:
+            self._writer.close()
+            await self._writer.wait_closed()
+            self._reader = self._writer = None
+        if self.scanned.is_set():
+            self.scanned.clear()
+        if self.connected.is_set():
+            self.connected.clear()
+
+    async def read_async(self, size):
+        try:
+            data = await asyncio.wait_for(self._reader.readexactly(size), self.timeout)
+        except asyncio.TimeoutError:
+            raise LinkTimeoutException()
+        self.bytes_in += size
+        if self.dump:
+            print("<", hexlify(data).upper())
+        return data
+
+    async def read_available_async(self):
+        try:
+            data = await asyncio.wait_for(self._reader.read(4096), self.timeout)
+        except asyncio.TimeoutError:
+            raise LinkTimeoutException()
+        if not data:
+            raise EOFError("TCP bridge closed the connection")
+        self.bytes_in += len(data)
+        if self.dump:
+            print("<", hexlify(data).upper())
+        return data
+
+    async def write_async(self, data):
+        if self.dump:
+            print(">", hexlify(data).upper())
+        self._writer.write(data)
+        self.bytes_out += len(data)
+        await self._writer.drain()
 
 
 __all__ = ["TCPLink"]
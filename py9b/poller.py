@@ -0,0 +1,210 @@
+"""Multi-rate register polling over one transport"""
+
+import time
+from collections import namedtuple
+from threading import Thread, Event, Lock
+from .stats import Histogram
+from .subscribers import Subscribers
+
+
+Sample = namedtuple("Sample", "time dev name value")
+
+
+class PollGroup(object):
+    """Registers of one device read together every interval seconds. Groups
+    with a lower priority value are read first when several are due."""
+
+    def __init__(self, regmap, names, interval, priority=0):
+        self.regmap = regmap
+        self.names = tuple(names)
+        self.interval = interval
+        self.priority = priority
+        self.next_due = 0.0
+        # counters: completed polls, skipped periods, registers that failed
+        self.polls = self.missed = self.errors = 0
+        self.jitter = Histogram()  # start delay past the due time
+
+    def snapshot(self):
+        return {
+            "interval": self.interval,
+            "polls": self.polls,
+            "missed": self.missed,
+            "errors": self.errors,
+            "jitter": self.jitter.snapshot(),
+        }
+
+
+class Poller(object):
+    """Reads register groups at their own rates.
+
+    Everything due at the same time is merged per device into one coalesced
+    ReadPlan and the blocks of all devices go out in one execute_many().
+    Every value read is delivered as a Sample to the subscribers. A group
+    that falls more than an interval behind skips the lost periods rather
+    than bursting to catch up, each counts in its missed counter.
+
+    With a RegisterShadow, registers it still holds within their ttl aren't
+    read and only values that changed are delivered.
+    """
+
+    def __init__(self, transport, window=4, shadow=None):
+        self.transport = transport
+        self.window = window
+        self.shadow = shadow
+        self.groups = []
+        self.error = None
+        self._subscribers = Subscribers()
+        self._lock = Lock()
+        self._stopped = Event()
+        self._th = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def add(self, regmap, names, interval, priority=0):
+        """Poll names of regmap every interval seconds, returns the group"""
+        group = PollGroup(regmap, names, interval, priority)
+        with self._lock:
+            self.groups.append(group)
+        return group
+
+    def remove(self, group):
+        with self._lock:
+            self.groups.remove(group)
+
+    def subscribe(self, callback):
+        """Call callback(sample) on the polling thread for every value read"""
+        return self._subscribers.add(callback)
+
+    def subscribe_queue(self, maxsize=0):
+        """Like subscribe(), but collect the samples into a new queue.Queue.
+        Samples are dropped when a bounded queue is full."""
+        return self._subscribers.add_queue(maxsize)
+
+    def unsubscribe(self, sub):
+        self._subscribers.remove(sub)
+
+    def stats(self):
+        with self._lock:
+            groups = list(self.groups)
+        return [
+            dict(g.snapshot(), dev=g.regmap.dev, names=g.names) for g in groups
+        ]
+
+    def next_due(self):
+        with self._lock:
+            return min(g.next_due for g in self.groups) if self.groups else None
+
+    def poll(self, now=None):
+        """Read every group due at now, return the number of groups read"""
+        if now is None:
+            now = time.time()
+        with self._lock:
+            due = [g for g in self.groups if g.next_due <= now]
+        if not due:
+            return 0
+        due.sort(key=lambda g: g.priority)
+
+        # one plan per device, devices in the order of their most urgent group
+        devs = []
+        names = {}
+        for g in due:
+            dev = g.regmap.dev
+            if dev not in names:
+                devs.append(g.regmap)
+                names[dev] = set()
+            names[dev].update(g.names)
+        shadow = self.shadow
+        if shadow is not None:
+            for m in devs:
+                names[m.dev] = shadow.stale(m, names[m.dev], now)
+        plans = [(m, m.plan(sorted(names[m.dev]))) for m in devs if names[m.dev]]
+
+        commands = []
+        for _, plan in plans:
+            commands.extend(plan.commands)
+        results = self.transport.execute_many(commands, self.window)
+
+        values = {}  # dev: {name: value}
+        ofs = 0
+        for regmap, plan in plans:
+            n = len(plan.commands)
+            res = plan.unpack(results[ofs : ofs + n])
+            ofs += n
+            values[regmap.dev] = dict(zip((r.name for r in plan.requests), res))
+        stamp = time.time()
+        if shadow is not None:
+            for regmap, _ in plans:
+                dev_values = values[regmap.dev]
+                changed = set(shadow.update(regmap, dev_values, stamp))
+                for name in list(dev_values):
+                    if name not in changed and not isinstance(dev_values[name], Exception):
+                        del dev_values[name]
+
+        for g in due:
+            late = now - g.next_due if g.next_due else 0.0
+            g.jitter.add(late)
+            skipped = int(late // g.interval) if g.interval else 0
+            g.missed += skipped
+            g.next_due = (g.next_due or now) + g.interval * (skipped + 1)
+            g.polls += 1
+            dev_values = values.get(g.regmap.dev, {})
+            for name in g.names:
+                if isinstance(dev_values.get(name), Exception):
+                    g.errors += 1
+        for dev, dev_values in values.items():
+            for name, value in dev_values.items():
+                if isinstance(value, Exception):
+                    continue
+                self._subscribers.notify(Sample(stamp, dev, name, value))
+        return len(due)
+
+    def run(self, duration=None):
+        """Poll until stop() or for duration seconds"""
+        self._stopped.clear()
+        self._loop(None if duration is None else time.time() + duration)
+
+    def _loop(self, end=None):
+        while not self._stopped.is_set():
+            now = time.time()
+            if end is not None and now >= end:
+                break
+            due = self.next_due()
+            if due is None or due > now:
+                wait = 0.1 if due is None else due - now
+                if end is not None:
+                    wait = min(wait, end - now)
+                self._stopped.wait(wait)
+                continue
+            self.poll(now)
+
+    def start(self):
+        if self._th:
+            return
+        self.error = None
+        self._stopped.clear()
+        self._th = Thread(target=self._run)
+        self._th.daemon = True
+        self._th.start()
+
+    def stop(self):
+        self._stopped.set()
+        if not self._th:
+            return
+        self._th.join()  # returns once the reads in progress are done
+        self._th = None
+
+    def _run(self):
+        try:
+            self._loop()
+        except Exception as e:
+            # the link is gone
+            self.error = e
+            self._stopped.set()
+
+
+__all__ = ["Sample", "PollGroup", "Poller"]
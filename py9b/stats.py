@@ -0,0 +1,61 @@
+"""Counters and latency histograms for links and transports
+
+Counters are plain attributes bumped without locking, snapshots are cheap
+copies meant for periodic export. Concurrent updates from several threads may
+very rarely lose an increment.
+"""
+
+from bisect import bisect_left
+
+
+class Histogram(object):
+    """Latency histogram with fixed bucket upper bounds, in seconds"""
+
+    BOUNDS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0, 5.0)
+
+    __slots__ = ("bounds", "counts", "count", "total", "max")
+
+    def __init__(self, bounds=BOUNDS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last bucket is +inf
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, value):
+        self.counts[bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def snapshot(self):
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "max": self.max,
+            "buckets": list(zip(self.bounds + (float("inf"),), self.counts)),
+        }
+
+
+class CommandStats(object):
+    """Per command type counters: requests sent, resends, timed out attempts,
+    rejected responses and round trip times of answered attempts"""
+
+    __slots__ = ("sent", "retries", "timeouts", "errors", "rtt")
+
+    def __init__(self):
+        self.sent = self.retries = self.timeouts = self.errors = 0
+        self.rtt = Histogram()
+
+    def snapshot(self):
+        return {
+            "sent": self.sent,
+            "retries": self.retries,
+            "timeouts": self.timeouts,
+            "errors": self.errors,
+            "rtt": self.rtt.snapshot(),
+        }
+
+
+__all__ = ["Histogram", "CommandStats"]
@@ -0,0 +1,59 @@
+"""Callback lists shared by the dispatcher, the poller and the shadow"""
+
+from threading import Lock
+
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+
+class Subscribers(object):
+    """Thread safe list of callbacks.
+
+    notify() calls them outside the lock, on the notifying thread, an
+    exception in one is printed and doesn't keep the others from running.
+    """
+
+    def __init__(self):
+        self._callbacks = []
+        self._lock = Lock()
+
+    def add(self, callback):
+        """Returns callback, the handle for remove()"""
+        with self._lock:
+            self._callbacks.append(callback)
+        return callback
+
+    def add_queue(self, maxsize=0, add=None):
+        """Collect the notified values into a new queue.Queue, dropping them
+        when a bounded queue is full. add(callback) registers the callback
+        (default: self.add), its handle is kept in queue.subscription."""
+        q = queue.Queue(maxsize)
+
+        def put(value):
+            try:
+                q.put_nowait(value)
+            except queue.Full:
+                pass
+
+        q.subscription = (add or self.add)(put)
+        return q
+
+    def remove(self, handle):
+        """Remove a callback by its handle or the queue add_queue() returned"""
+        handle = getattr(handle, "subscription", handle)
+        with self._lock:
+            self._callbacks.remove(handle)
+
+    def notify(self, *args):
+        with self._lock:
+            callbacks = list(self._callbacks)
+        for callback in callbacks:
+            try:
+                callback(*args)
+            except Exception as e:
+                print("Subscriber error:", repr(e))
+
+
+__all__ = ["Subscribers"]
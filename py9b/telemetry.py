@@ -0,0 +1,269 @@
+"""Append-only columnar telemetry store
+
+A store is a directory holding one series per register: <name>.time with
+little endian float64 timestamps and <name>.value with fixed width values,
+plus columns.json mapping every name to its struct type code. Files are only
+ever appended to, a reader maps them and slices by time without loading
+them. With NumPy installed the reader returns arrays, otherwise memoryviews
+(values are little endian, as are the hosts this runs on).
+"""
+
+import json
+import mmap
+import os
+from bisect import bisect_left
+from struct import Struct
+from .transport.base import BaseTransport as BT
+from .command.regmap import REGISTER_MAPS
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+_TIME = Struct("<d")
+
+# struct type code: numpy dtype, fixed sizes only ("l"/"L" are stored as i/I)
+_DTYPES = {
+    "b": "<i1",
+    "B": "<u1",
+    "h": "<i2",
+    "H": "<u2",
+    "i": "<i4",
+    "I": "<u4",
+    "q": "<i8",
+    "Q": "<u8",
+    "f": "<f4",
+    "d": "<f8",
+}
+
+_COLUMNS = "columns.json"
+
+
+def column_type(format, scale=None):
+    """Type code a register with struct format and scale is stored as"""
+    if scale is not None:
+        return "d"
+    code = format.lstrip("<>=!@")
+    code = {"l": "i", "L": "I"}.get(code, code)
+    if code not in _DTYPES:
+        raise ValueError("Can't store %r in a column" % (format,))
+    return code
+
+
+def sample_column(sample):
+    """Column name for a poller Sample, e.g. esc.total_mileage"""
+    return "%s.%s" % (BT.GetDeviceName(sample.dev).lower(), sample.name)
+
+
+class TelemetryWriter(object):
+    """Appends timestamped values to the series of a store.
+
+    columns maps names to type codes (see column_type()), columns already in
+    the store are kept. Timestamps within a series must not go backwards,
+    the reader relies on it for slicing. regmaps ({device: RegisterMap},
+    default REGISTER_MAPS) give add_sample() the register formats.
+    """
+
+    def __init__(self, path, columns=None, regmaps=None):
+        self.path = path
+        self.regmaps = REGISTER_MAPS if regmaps is None else regmaps
+        if not os.path.isdir(path):
+            os.makedirs(path)
+        self.columns = _load_columns(path)
+        self._files = {}  # name: (time file, value file, value Struct)
+        self._last = {}  # name: last timestamp
+        for name, code in (columns or {}).items():
+            self.add_column(name, code)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def add_column(self, name, code):
+        if name in self.columns:
+            if self.columns[name] != code:
+                raise ValueError(
+                    "Column %s is stored as %r, not %r" % (name, self.columns[name], code)
+                )
+            return
+        if code not in _DTYPES:
+            raise ValueError("Unknown column type %r" % (code,))
+        self.columns[name] = code
+        tmp = os.path.join(self.path, _COLUMNS + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(self.columns, f, indent=1, sort_keys=True)
+        os.replace(tmp, os.path.join(self.path, _COLUMNS))
+
+    def add_register(self, name, register):
+        """Add a column for a regmap.Register"""
+        self.add_column(name, column_type(register.format, register.scale))
+
+    def _open(self, name):
+        if name not in self.columns:
+            raise KeyError("No column %s" % (name,))
+        base = os.path.join(self.path, name)
+        tf = open(base + ".time", "ab")
+        vf = open(base + ".value", "ab")
+        # a crash may have left one file a row ahead of the other
+        rows = min(tf.tell() // _TIME.size, vf.tell() // _value_size(self.columns[name]))
+        for f, size in ((tf, _TIME.size), (vf, _value_size(self.columns[name]))):
+            if f.tell() != rows * size:
+                f.truncate(rows * size)
+                f.seek(rows * size)
+        if rows:
+            with open(base + ".time", "rb") as f:
+                f.seek((rows - 1) * _TIME.size)
+                self._last[name] = _TIME.unpack(f.read(_TIME.size))[0]
+        res = self._files[name] = (tf, vf, Struct("<" + self.columns[name]))
+        return res
+
+    def append(self, name, time, value):
+        files = self._files.get(name)
+        if files is None:
+            files = self._open(name)
+        if time < self._last.get(name, time):
+            raise ValueError("Timestamp going backwards in %s" % (name,))
+        tf, vf, st = files
+        vf.write(st.pack(value))
+        tf.write(_TIME.pack(time))
+        self._last[name] = time
+
+    def add_sample(self, sample):
+        """Store a poller Sample, usable as Poller.subscribe() callback. New
+        columns take the type of the sample's register, or the widest type
+        for registers not in self.regmaps. Values that don't fit a column
+        (strings) are ignored."""
+        name = sample_column(sample)
+        if name not in self.columns:
+            regmap = self.regmaps.get(sample.dev)
+            if regmap is not None and sample.name in regmap:
+                reg = regmap[sample.name]
+                try:
+                    code = column_type(reg.format, reg.scale)
+                except ValueError:
+                    return
+            elif isinstance(sample.value, float):
+                code = "d"
+            elif isinstance(sample.value, int) and not isinstance(sample.value, bool):
+                code = "q"
+            else:
+                return
+            self.add_column(name, code)
+        self.append(name, sample.time, sample.value)
+
+    def flush(self):
+        for tf, vf, _ in self._files.values():
+            vf.flush()
+            tf.flush()
+
+    def close(self):
+        self.flush()
+        for tf, vf, _ in self._files.values():
+            vf.close()
+            tf.close()
+        self._files = {}
+
+
+class TelemetryReader(object):
+    """Memory mapped, read only view of a store.
+
+    Each file is mapped once and the map reused by later series() calls, it's
+    only mapped again once a writer has appended to the file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.columns = _load_columns(path)
+        self._maps = {}  # filename: map
+        self._retired = []  # maps replaced while views into them were alive
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _map(self, filename):
+        if self._retired:
+            self._retired = [mm for mm in self._retired if not _close_map(mm)]
+        path = os.path.join(self.path, filename)
+        size = os.path.getsize(path)
+        mm = self._maps.get(filename)
+        if mm is not None and len(mm) == size:
+            return mm
+        if not size:
+            return b""
+        with open(path, "rb") as f:
+            self._maps[filename] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if mm is not None and not _close_map(mm):
+            self._retired.append(mm)
+        return self._maps[filename]
+
+    def _column(self, buf, code, rows):
+        if np is not None:
+            return np.frombuffer(buf, dtype=_DTYPES[code], count=rows)
+        return memoryview(buf)[: rows * _value_size(code)].cast(code)
+
+    def series(self, name, start=None, end=None):
+        """Return (times, values) of name with start <= time < end, both
+        views into the mapped files"""
+        code = self.columns[name]
+        try:
+            tbuf = self._map(name + ".time")
+            vbuf = self._map(name + ".value")
+        except (IOError, OSError):
+            tbuf = vbuf = b""
+        rows = min(len(tbuf) // _TIME.size, len(vbuf) // _value_size(code))
+        times = self._column(tbuf, "d", rows)
+        values = self._column(vbuf, code, rows)
+        lo = 0 if start is None else _search(times, start)
+        hi = rows if end is None else _search(times, end)
+        return times[lo:hi], values[lo:hi]
+
+    def close(self):
+        # a map with arrays or views still pointing into it can't be closed,
+        # it's unmapped once the last of them is gone
+        maps = list(self._maps.values()) + self._retired
+        self._maps = {}
+        self._retired = []
+        for mm in maps:
+            _close_map(mm)
+
+
+def _close_map(mm):
+    """Close mm, False if views into it are still alive"""
+    try:
+        mm.close()
+    except BufferError:
+        return False
+    return True
+
+
+def _value_size(code):
+    return Struct("<" + code).size
+
+
+def _search(times, t):
+    if np is not None and isinstance(times, np.ndarray):
+        return int(np.searchsorted(times, t, "left"))
+    return bisect_left(times, t)
+
+
+def _load_columns(path):
+    try:
+        with open(os.path.join(path, _COLUMNS)) as f:
+            return json.load(f)
+    except (IOError, OSError):
+        return {}
+
+
+__all__ = [
+    "column_type",
+    "sample_column",
+    "TelemetryWriter",
+    "TelemetryReader",
+]
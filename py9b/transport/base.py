@@ -1,12 +1,181 @@
 """Transport abstract class"""
 
+import asyncio
 import time
+from collections import deque
+from struct import Struct
+from ..link.base import LinkTimeoutException
+from .policy import AdaptiveRetryPolicy
+from ..stats import CommandStats
+
+_CHECKSUM = Struct("<H")
+
+
+class FrameTimeoutException(LinkTimeoutException):
+    """A frame started arriving but wasn't complete by the deadline"""
+
+    pass
+
 
 def checksum(data):
-    s = 0
-    for c in data:
-        s += c
-    return (s & 0xFFFF) ^ 0xFFFF
+    return (sum(data) & 0xFFFF) ^ 0xFFFF
+
+
+class BaseDecoder(object):
+    """Incremental frame decoder: feed() raw link bytes, decode() complete packets"""
+
+    PREAMBLE = b""
+    HEADER_SIZE = 4  # preamble + length byte + source address
+    MAX_DATA = 0xFF  # largest payload the length byte can declare
+
+    def __init__(self, max_data=None, device_max_data=None):
+        self.buf = bytearray()
+        # frames declaring a longer payload than max_data, or than the limit
+        # device_max_data ({device: size}) sets for their source, are taken
+        # for a false preamble. Both default to the protocol maximum: a
+        # limit below what a device really sends turns its replies into
+        # timeouts, callers opt in with limits they know
+        self.max_data = self.MAX_DATA if max_data is None else max_data
+        self.device_max_data = dict(
+            (dev, min(size, self.max_data))
+            for dev, size in (device_max_data or {}).items()
+        )
+        # counters: valid frames, bad checksums, bytes skipped looking for a
+        # preamble, times frame sync was regained after skipping bytes, frames
+        # rejected for their length, frames dropped because they stalled,
+        # valid frames that didn't make a packet (unknown bus address)
+        self.frames = self.checksum_errors = self.discarded = self.resyncs = 0
+        self.rejected = self.stalls = self.unparsed = 0
+        self.partial_since = None  # when the incomplete frame in buf was seen
+        self._lost_sync = False
+
+    def feed(self, data):
+        self.buf += data
+
+    def reset(self):
+        del self.buf[:]
+        self.partial_since = None
+
+    def _find_preamble(self, start):
+        return self.buf.find(self.PREAMBLE, start)
+
+    def _data_size(self, start):
+        """Payload length declared by the header at start"""
+        raise NotImplementedError()
+
+    def _source(self, start):
+        """Device the frame at start comes from, None if the header doesn't
+        tell"""
+        return None
+
+    def _frame_size(self, start):
+        raise NotImplementedError()
+
+    def _parse(self, frame):
+        """Build a packet from a memoryview of a complete frame, must not keep it.
+        None (or KeyError/ValueError/IndexError) drops a frame that has no
+        packet representation."""
+        raise NotImplementedError()
+
+    def decode(self):
+        """Return the next complete packet or None if more data is needed"""
+        buf = self.buf
+        while True:
+            start = self._find_preamble(0)
+            if start < 0:
+                # keep the last byte, it may be the first half of a preamble
+                if len(buf) > 1:
+                    self._skip(len(buf) - 1)
+                self.partial_since = None
+                return None
+            if start:
+                self._skip(start)
+            if len(buf) < self.HEADER_SIZE:
+                return self._partial()
+            limit = self.device_max_data.get(self._source(0), self.max_data)
+            if not 0 <= self._data_size(0) <= limit:
+                self.rejected += 1
+                self._skip(1)
+                continue
+            size = self._frame_size(0)
+            if len(buf) < size:
+                return self._partial()
+            self.partial_since = None
+            # parse straight from the receive buffer, only the payload is copied
+            view = memoryview(buf)
+            frame = view[:size]
+            valid = False
+            try:
+                valid = (
+                    checksum(frame[2:-2]) == _CHECKSUM.unpack_from(frame, size - 2)[0]
+                )
+                if valid:
+                    pkt = self._parse(frame)
+            except (KeyError, ValueError, IndexError):
+                # checksum passed but the content makes no packet, one such
+                # frame must not stop everything reading from the transport
+                pkt = None
+            finally:
+                frame.release()
+                view.release()
+                if valid:
+                    del buf[:size]
+            if not valid:
+                # the preamble was false or the frame lost bytes, either way
+                # the next real frame may start inside it: rescan from the
+                # byte after the preamble
+                self.checksum_errors += 1
+                self._skip(1)
+                continue
+            if self._lost_sync:
+                self._lost_sync = False
+                self.resyncs += 1
+            if pkt is None:
+                self.unparsed += 1
+                continue
+            self.frames += 1
+            return pkt
+
+    def _partial(self):
+        if self.partial_since is None:
+            self.partial_since = time.time()
+        return None
+
+    def _skip(self, size):
+        del self.buf[:size]
+        self.discarded += size
+        self.partial_since = None
+        self._lost_sync = True
+
+    def drop_partial(self):
+        """Give up on the incomplete frame at the head of the buffer, decoding
+        resumes at the next preamble"""
+        if self.partial_since is not None:
+            self.stalls += 1
+            self._skip(1)
+
+    def stats(self):
+        return {
+            "frames": self.frames,
+            "checksum_errors": self.checksum_errors,
+            "discarded": self.discarded,
+            "resyncs": self.resyncs,
+            "rejected": self.rejected,
+            "stalls": self.stalls,
+            "unparsed": self.unparsed,
+        }
+
+    def push(self, data):
+        """Buffer a chunk of link data, return an iterator over completed packets"""
+        self.feed(data)
+        return iter(self)
+
+    def __iter__(self):
+        while True:
+            pkt = self.decode()
+            if pkt is None:
+                return
+            yield pkt
 
 
 class BaseTransport(object):
@@ -17,6 +186,9 @@ class BaseTransport(object):
     EXTBMS = 0x23
     HOST = 0x3D
 
+    DEF_FRAME_TIMEOUT = 0.5
+    FRAME_CACHE_SIZE = 256
+
     DeviceNames = {
         MOTOR: "MOTOR",
         ESC: "ESC",
@@ -26,40 +198,316 @@ class BaseTransport(object):
         HOST: "HOST",
     }
 
-    def __init__(self, link):
+    def __init__(self, link, decoder=None):
         self.link = link
-        self.retries = 10
+        self.decoder = decoder
+        self.dispatcher = None
+        self.policy = AdaptiveRetryPolicy()
+        self.command_stats = {}  # command class name: CommandStats
+        # longest a started frame may take to complete, bounds the damage of a
+        # corrupted length byte
+        self.frame_timeout = BaseTransport.DEF_FRAME_TIMEOUT
+        self._frames = {}  # packet: encoded frame
+        self._pinned = {}  # same, exempt from eviction
+        self.shadow = None  # RegisterShadow told about every request sent
 
-    def recv(self):
-        raise NotImplementedError()
+    def _command_stats(self, command):
+        name = type(command).__name__
+        cs = self.command_stats.get(name)
+        if cs is None:
+            cs = self.command_stats[name] = CommandStats()
+        return cs
 
-    def send(self, src, dst, cmd, arg, data=bytearray()):
+    def stats(self):
+        """Snapshot of link, decoder and per command type counters"""
+        res = {"link": self.link.stats()}
+        if self.decoder is not None:
+            res["decoder"] = self.decoder.stats()
+        res["commands"] = dict(
+            (name, cs.snapshot()) for name, cs in list(self.command_stats.items())
+        )
+        return res
+
+    def recv(self, timeout=None):
+        """Return the next packet, waiting up to timeout seconds (default: the
+        link's timeout) for it"""
+        if timeout is None:
+            timeout = self.link.timeout
+        return self._recv_before(time.time() + timeout)
+
+    def drain(self, quiet=0.2, commands=()):
+        """Wait until no frame arrived for quiet seconds, throwing away what
+        does arrive: late responses would be taken for answers to the next
+        requests. With commands (just abandoned) it lasts at least their
+        longest response timeout, as they may still be answered that late.
+        While a dispatcher runs it routes the frames as usual."""
+        wait = max([self._timeout(c) for c in commands] or [0])
+        if self.dispatcher is not None:
+            return self.dispatcher.drain(quiet, wait)
+        until = time.time() + wait
+        while True:
+            try:
+                self.recv(max(quiet, until - time.time()))
+            except LinkTimeoutException:
+                return
+
+    def encode(self, packet):
+        """Return the complete frame for packet"""
         raise NotImplementedError()
 
-    def execute(self, command, retries=None):
-        exc = None
-        self.send(command.request)
+    def frame(self, packet):
+        """Encoded frame for packet, cached so that polled requests are only
+        encoded once. Packets with a mutable payload aren't cached."""
+        try:
+            return self._frames[packet]
+        except KeyError:
+            pass
+        except TypeError:
+            return self.encode(packet)
+        frame = self._pinned.get(packet)
+        if frame is not None:
+            return frame
+        frame = self.encode(packet)
+        if len(self._frames) >= self.FRAME_CACHE_SIZE:
+            self._frames.clear()
+        self._frames[packet] = frame
+        return frame
+
+    def pin_frames(self, packets):
+        """Encode packets up front and keep their frames until unpin_frames(),
+        whatever the cache size"""
+        for packet in packets:
+            self._pinned[packet] = self.encode(packet)
+
+    def unpin_frames(self):
+        self._pinned.clear()
+
+    def invalidate_frames(self):
+        """Forget cached frames, called when encoding parameters change"""
+        self._frames.clear()
+        self._pinned.clear()
+
+    def send(self, packet):
+        self.link.write(self.frame(packet))
+
+    async def recv_async(self):
+        decoder = self.decoder
+        while True:
+            pkt = decoder.decode()
+            if pkt is not None:
+                return pkt
+            if self._frame_time_left(time.time()) == 0:
+                continue
+            decoder.feed(await self.link.read_available_async())
+
+    async def send_async(self, packet):
+        await self.link.write_async(self.frame(packet))
+
+    # Bookkeeping shared by all execute variants: feeds the retry policy and
+    # the per command type counters
+
+    def _sent(self, command, attempt):
+        if self.shadow is not None:
+            self.shadow.sent(command)
+        cs = self._command_stats(command)
+        cs.sent += 1
+        if attempt:
+            cs.retries += 1
+
+    def _answered(self, command, attempt, rtt):
+        if not attempt:
+            req = command.request
+            self.policy.update(self.link, req.dst, req.cmd, rtt)
+        self._command_stats(command).rtt.add(rtt)
+
+    def _timed_out(self, command):
+        req = command.request
+        self.policy.timed_out(self.link, req.dst, req.cmd)
+        self._command_stats(command).timeouts += 1
+
+    def _handle_response(self, command, rsp):
         try:
-            rsp = self.recv()
             return command.handle_response(rsp)
-        except Exception as e:
-            exc = e
-            for n in range(retries or self.retries):
-                try:
-                    rsp = self.recv()
-                    return command.handle_response(rsp)
-                except Exception as e:
-                    exc = e
-                if command.has_response:
-                    exc = None
-                    self.retries = 0
-                if exc is not None:
-                    raise exc
-        self.retries = 10
+        except Exception:
+            self._command_stats(command).errors += 1
+            raise
+
+    def _timeout(self, command):
+        req = command.request
+        return self.policy.timeout(self.link, req.dst, req.cmd)
+
+    async def _recv_match_async(self, command):
+        while True:
+            rsp = await self.recv_async()
+            if command.match(rsp):
+                return rsp
+
+    async def execute_async(self, command, retries=None, timeout=None, deadline=None):
+        """Coroutine version of execute()"""
+        if retries is None:
+            retries = self.policy.retries
+        for n in range(retries + 1):
+            sent = time.time()
+            if deadline is not None and sent >= deadline:
+                break
+            await self.send_async(command.request)
+            self._sent(command, n)
+            wait = self._timeout(command) if timeout is None else timeout
+            if deadline is not None:
+                wait = min(wait, deadline - sent)
+            try:
+                rsp = await asyncio.wait_for(self._recv_match_async(command), wait)
+            except (asyncio.TimeoutError, LinkTimeoutException):
+                self._timed_out(command)
+                continue
+            self._answered(command, n, time.time() - sent)
+            return self._handle_response(command, rsp)
+        if command.has_response:
+            return None  # response is optional
+        raise LinkTimeoutException()
+
+    def _frame_time_left(self, now):
+        """Time the incomplete frame in the decoder has left to complete, None
+        if there's none. A stalled frame is dropped and 0 returned."""
+        since = self.decoder.partial_since
+        if since is None:
+            return None
+        left = since + self.frame_timeout - now
+        if left <= 0:
+            # most likely a corrupted length byte, look for the next frame
+            self.decoder.drop_partial()
+            return 0
+        return left
+
+    def _recv_before(self, deadline):
+        decoder = self.decoder
+        while True:
+            pkt = decoder.decode()
+            if pkt is not None:
+                return pkt
+            now = time.time()
+            left = self._frame_time_left(now)
+            if left == 0:
+                continue
+            timeout = deadline - now
+            if timeout <= 0:
+                if left is not None:
+                    raise FrameTimeoutException()
+                raise LinkTimeoutException()
+            if left is None:
+                decoder.feed(self.link.read_available(timeout))
+                continue
+            try:
+                decoder.feed(self.link.read_available(min(left, timeout)))
+            except LinkTimeoutException:
+                pass  # next pass drops the stalled frame or reports it
+
+    def _recv_match(self, command, deadline):
+        while True:
+            pkt = self._recv_before(deadline)
+            if command.match(pkt):
+                return pkt
+
+    def execute(self, command, retries=None, timeout=None, deadline=None):
+        """Send command's request until a matching response arrives.
+
+        Frames that don't match the command are skipped. Response timeout and
+        number of resends default to self.policy. deadline (a time.time()
+        value) bounds the whole call, resends included. Commands with
+        has_response set return None rather than raise when no response
+        arrives.
+        """
+        if self.dispatcher is not None:
+            return self.dispatcher.execute(command, retries, timeout, deadline)
+        if retries is None:
+            retries = self.policy.retries
+        exc = LinkTimeoutException()
+        for n in range(retries + 1):
+            sent = time.time()
+            if deadline is not None and sent >= deadline:
+                break
+            self.send(command.request)
+            self._sent(command, n)
+            until = sent + (self._timeout(command) if timeout is None else timeout)
+            if deadline is not None:
+                until = min(until, deadline)
+            try:
+                rsp = self._recv_match(command, until)
+            except LinkTimeoutException as e:
+                self._timed_out(command)
+                exc = e
+                continue
+            self._answered(command, n, time.time() - sent)
+            return self._handle_response(command, rsp)
+        if command.has_response:
+            return None  # response is optional
+        raise exc
+
+    def execute_many(self, commands, window=4, retries=None, timeout=None):
+        """Execute commands keeping up to window requests in flight.
+
+        Responses are matched back to commands with BaseCommand.match(), results
+        are returned in command order. A command that got no response after
+        retries resends, or whose response was rejected, gets the exception in
+        place of its result, one with has_response set gets None. Timeouts and
+        retries default to self.policy.
+        """
+        if self.dispatcher is not None:
+            return self.dispatcher.execute_many(commands, window, retries, timeout)
+        if retries is None:
+            retries = self.policy.retries
+        commands = list(commands)
+        results = [None] * len(commands)
+        sends = [0] * len(commands)
+        pending = deque(range(len(commands)))
+        inflight = []  # (deadline, index, sent) in send order
+
+        def expire(inflight):
+            for deadline, i, sent in inflight:
+                self._timed_out(commands[i])
+                if sends[i] > retries:
+                    # like execute(), None for an optional response
+                    if not commands[i].has_response:
+                        results[i] = LinkTimeoutException()
+                else:
+                    pending.appendleft(i)
+
+        while pending or inflight:
+            while pending and len(inflight) < window:
+                i = pending.popleft()
+                sent = time.time()
+                self.send(commands[i].request)
+                self._sent(commands[i], sends[i])
+                sends[i] += 1
+                if timeout is None:
+                    deadline = sent + self._timeout(commands[i])
+                else:
+                    deadline = sent + timeout
+                inflight.append((deadline, i, sent))
+            try:
+                rsp = self._recv_before(min(inflight)[0])
+            except LinkTimeoutException:
+                rsp = None
+            if rsp is not None:
+                for n, (deadline, i, sent) in enumerate(inflight):
+                    if commands[i].match(rsp):
+                        del inflight[n]
+                        self._answered(commands[i], sends[i] - 1, time.time() - sent)
+                        try:
+                            results[i] = self._handle_response(commands[i], rsp)
+                        except Exception as e:
+                            results[i] = e
+                        break
+            # unsolicited traffic must not keep lost requests alive
+            now = time.time()
+            if inflight and min(inflight)[0] <= now:
+                expire(reversed([x for x in inflight if x[0] <= now]))
+                inflight = [x for x in inflight if x[0] > now]
+        return results
 
     @staticmethod
     def GetDeviceName(dev):
         return BaseTransport.DeviceNames.get(dev, "%02X" % (dev))
 
 
-__all__ = ["checksum", "BaseTransport"]
+__all__ = ["FrameTimeoutException", "checksum", "BaseDecoder", "BaseTransport"]
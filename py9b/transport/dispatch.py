@@ -0,0 +1,233 @@
+"""Background receive thread routing frames to commands and subscribers"""
+
+import time
+from collections import deque
+from concurrent import futures
+from threading import Thread, Event, Lock
+from ..link.base import LinkTimeoutException
+from ..subscribers import Subscribers
+
+
+class DispatcherStopped(Exception):
+    pass
+
+
+class Dispatcher(object):
+    """Owns the receive side of a transport.
+
+    Every received frame goes to the oldest in-flight command that matches it
+    (BaseCommand.match(): from the request's destination, addressed to its
+    sender, carrying the expected cmd), anything else (bus broadcasts between
+    other devices, late responses) to the matching subscribers.
+    While running, the transport's execute() and execute_many() go through the
+    dispatcher, so commands and a sniffer can share one connection. Don't call
+    transport.recv() directly while it runs.
+    """
+
+    def __init__(self, transport):
+        self.transport = transport
+        self.error = None
+        self._waiters = []  # (command, future) in submit order
+        self._subscribers = Subscribers()
+        self._lock = Lock()
+        self._send_lock = Lock()
+        self._running = Event()
+        self._th = None
+        self._last_received = 0.0
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def start(self):
+        if self._th:
+            return
+        self.error = None
+        self._running.set()
+        self._th = Thread(target=self._run)
+        self._th.daemon = True
+        self._th.start()
+        self.transport.dispatcher = self
+
+    def stop(self):
+        if not self._th:
+            return
+        self._running.clear()
+        self._th.join()  # returns within a link timeout
+        self._th = None
+        if self.transport.dispatcher is self:
+            self.transport.dispatcher = None
+        self._fail_waiters(DispatcherStopped())
+
+    def subscribe(self, callback, src=None, dst=None, cmd=None):
+        """Call callback(packet) on the receive thread for unsolicited frames
+        matching src/dst/cmd (None matches anything). Returns a handle for
+        unsubscribe()."""
+
+        def filtered(pkt):
+            if (
+                (src is None or src == pkt.src)
+                and (dst is None or dst == pkt.dst)
+                and (cmd is None or cmd == pkt.cmd)
+            ):
+                callback(pkt)
+
+        return self._subscribers.add(filtered)
+
+    def subscribe_queue(self, src=None, dst=None, cmd=None, maxsize=0):
+        """Like subscribe(), but collect the frames into a new queue.Queue.
+        Frames are dropped when a bounded queue is full."""
+        return self._subscribers.add_queue(
+            maxsize, lambda put: self.subscribe(put, src, dst, cmd)
+        )
+
+    def unsubscribe(self, sub):
+        self._subscribers.remove(sub)
+
+    def submit(self, command):
+        """Send command's request, return a Future resolved with its result"""
+        if not self._running.is_set():
+            raise DispatcherStopped()
+        fut = futures.Future()
+        waiter = fut.waiter = (command, fut)
+        with self._lock:
+            self._waiters.append(waiter)
+        try:
+            with self._send_lock:
+                self.transport.send(command.request)
+        except Exception:
+            self._cancel(waiter)
+            raise
+        return fut
+
+    def _wait(self, fut, command, attempt, sent, timeout):
+        """Wait for fut, False if it timed out. Does the transport bookkeeping"""
+        tran = self.transport
+        try:
+            fut.exception(timeout)
+        except futures.TimeoutError:
+            self._cancel(fut.waiter)
+            tran._timed_out(command)
+            return False
+        if hasattr(fut, "received"):  # else failed by stop()
+            tran._answered(command, attempt, fut.received - sent)
+        return True
+
+    def execute(self, command, retries=None, timeout=None, deadline=None):
+        """See BaseTransport.execute()"""
+        tran = self.transport
+        if retries is None:
+            retries = tran.policy.retries
+        for n in range(retries + 1):
+            sent = time.time()
+            if deadline is not None and sent >= deadline:
+                break
+            fut = self.submit(command)
+            tran._sent(command, n)
+            wait = tran._timeout(command) if timeout is None else timeout
+            if deadline is not None:
+                wait = min(wait, deadline - sent)
+            if self._wait(fut, command, n, sent, wait):
+                return fut.result()
+        if command.has_response:
+            return None  # response is optional
+        raise LinkTimeoutException()
+
+    def execute_many(self, commands, window=4, retries=None, timeout=None):
+        """See BaseTransport.execute_many()"""
+        tran = self.transport
+        if retries is None:
+            retries = tran.policy.retries
+        commands = list(commands)
+        results = [None] * len(commands)
+        sends = [0] * len(commands)
+        pending = deque(range(len(commands)))
+        inflight = deque()  # (index, sent, deadline, future) in send order
+        while pending or inflight:
+            while pending and len(inflight) < window:
+                i = pending.popleft()
+                sent = time.time()
+                fut = self.submit(commands[i])
+                tran._sent(commands[i], sends[i])
+                sends[i] += 1
+                if timeout is None:
+                    deadline = sent + tran._timeout(commands[i])
+                else:
+                    deadline = sent + timeout
+                inflight.append((i, sent, deadline, fut))
+            i, sent, deadline, fut = inflight.popleft()
+            if self._wait(
+                fut, commands[i], sends[i] - 1, sent, max(deadline - time.time(), 0)
+            ):
+                try:
+                    results[i] = fut.result()
+                except Exception as e:
+                    results[i] = e
+            elif sends[i] > retries:
+                if not commands[i].has_response:
+                    results[i] = LinkTimeoutException()
+            else:
+                pending.appendleft(i)
+        return results
+
+    def drain(self, quiet=0.2, wait=0):
+        """See BaseTransport.drain(), lasts at least wait seconds. Frames
+        arriving meanwhile go to waiting commands and subscribers as usual,
+        none of them to a command that isn't submitted yet."""
+        until = time.time() + wait
+        while True:
+            left = max(self._last_received + quiet, until) - time.time()
+            if left <= 0:
+                return
+            time.sleep(left)
+
+    def _cancel(self, waiter):
+        with self._lock:
+            if waiter in self._waiters:
+                self._waiters.remove(waiter)
+
+    def _fail_waiters(self, exc):
+        with self._lock:
+            waiters, self._waiters = self._waiters, []
+        for command, fut in waiters:
+            fut.set_exception(exc)
+
+    def _dispatch(self, pkt):
+        with self._lock:
+            for waiter in self._waiters:
+                if waiter[0].match(pkt):
+                    self._waiters.remove(waiter)
+                    break
+            else:
+                waiter = None
+        if waiter is None:
+            self._subscribers.notify(pkt)
+            return
+        command, fut = waiter
+        fut.received = time.time()
+        try:
+            fut.set_result(self.transport._handle_response(command, pkt))
+        except Exception as e:
+            fut.set_exception(e)
+
+    def _run(self):
+        while self._running.is_set():
+            try:
+                pkt = self.transport.recv()
+            except LinkTimeoutException:
+                continue
+            except Exception as e:
+                # the decoder drops frames it can't parse, so this came from
+                # the link: it's gone, don't leave anybody waiting for it
+                self.error = e
+                self._running.clear()
+                self._fail_waiters(e)
+                break
+            self._last_received = time.time()
+            self._dispatch(pkt)
+
+
+__all__ = ["DispatcherStopped", "Dispatcher"]
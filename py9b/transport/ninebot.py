@@ -1,56 +1,45 @@
 """Ninebot packet transport"""
-from struct import pack, unpack
-from .base import checksum, BaseTransport as BT
+from struct import Struct
+from .base import checksum, BaseDecoder, BaseTransport as BT
 from .packet import BasePacket
 
+_HEADER = Struct("<BBBBB")  # len, src, dst, cmd, arg
+_CHECKSUM = Struct("<H")
+
+
+class NinebotDecoder(BaseDecoder):
+    PREAMBLE = b"\x5A\xA5"
+
+    def _data_size(self, start):
+        return self.buf[start + 2]
+
+    def _source(self, start):
+        return self.buf[start + 3]
+
+    def _frame_size(self, start):
+        # preamble, len, src, dst, cmd, arg, data, checksum
+        return self.buf[start + 2] + 9
+
+    def _parse(self, frame):
+        _, sa, da, cmd, arg = _HEADER.unpack_from(frame, 2)
+        return BasePacket(sa, da, cmd, arg, frame[7:-2].tobytes())
+
 
 class NinebotTransport(BT):
-    def __init__(self, link, device=BT.HOST):
-        super(NinebotTransport, self).__init__(link)
+    def __init__(self, link, device=BT.HOST, max_data=None, device_max_data=None):
+        super(NinebotTransport, self).__init__(
+            link, NinebotDecoder(max_data, device_max_data)
+        )
         self.device = device
 
-    def _wait_pre(self):
-        while True:
-            while True:
-                c = self.link.read(1)
-                if c == b"\x5A":
-                    break
-            while True:
-                c = self.link.read(1)
-                if c == b"\xA5":
-                    return True
-                if c != b"\x5A":
-                    break  # start waiting 5A again, else - this is 5A, so wait for A5
-
-    def recv(self):
-        self._wait_pre()
-        pkt = self.link.read(1)
-        l = ord(pkt) + 6
-        for i in range(l):
-            pkt += self.link.read(1)
-        ck_calc = checksum(pkt[0:-2])
-        ck_pkt = unpack("<H", pkt[-2:])[0]
-        if ck_pkt != ck_calc:
-            print("Checksum mismatch !")
-            return None
-        return BasePacket(
-            pkt[1], pkt[2], pkt[3], pkt[4], pkt[5:-2]
-        )  # sa, da, cmd, arg, data
-
-    def send(self, packet):
+    def encode(self, packet):
         pkt = (
-            pack(
-                "<BBBBB",
-                len(packet.data),
-                packet.src,
-                packet.dst,
-                packet.cmd,
-                packet.arg,
+            _HEADER.pack(
+                len(packet.data), packet.src, packet.dst, packet.cmd, packet.arg
             )
             + packet.data
         )
-        pkt = b"\x5A\xA5" + pkt + pack("<H", checksum(pkt))
-        self.link.write(pkt)
+        return b"\x5A\xA5" + pkt + _CHECKSUM.pack(checksum(pkt))
 
 
-__all__ = ["NinebotTransport"]
+__all__ = ["NinebotDecoder", "NinebotTransport"]
@@ -1,14 +1,13 @@
 from binascii import hexlify
+from collections import namedtuple
 from .base import BaseTransport as BT
 
 
-class BasePacket(object):
-    def __init__(self, src=0, dst=0, cmd=0, arg=0, data=bytearray()):
-        self.src = src
-        self.dst = dst
-        self.cmd = cmd
-        self.arg = arg
-        self.data = data
+class BasePacket(namedtuple("BasePacket", "src dst cmd arg data")):
+    __slots__ = ()
+
+    def __new__(cls, src=0, dst=0, cmd=0, arg=0, data=b""):
+        return super(BasePacket, cls).__new__(cls, src, dst, cmd, arg, data)
 
     def __str__(self):
         return "%s->%s: %02X @%02X %s" % (
@@ -0,0 +1,93 @@
+"""Retry and response timeout policies for BaseTransport.execute"""
+
+from threading import Lock
+
+
+class RetryPolicy(object):
+    """Fixed number of resends, fixed response timeout.
+
+    Policies are keyed by (link, device, request cmd), they can be shared
+    between transports and threads. A timeout of None uses the link's own
+    timeout.
+    """
+
+    def __init__(self, retries=3, timeout=None):
+        self.retries = retries
+        self._timeout = timeout
+
+    def timeout(self, link, dev, cmd):
+        """Seconds to wait for the response to a cmd request sent to dev"""
+        return link.timeout if self._timeout is None else self._timeout
+
+    def update(self, link, dev, cmd, rtt):
+        """Record the round trip time of an answered first attempt"""
+        pass
+
+    def timed_out(self, link, dev, cmd):
+        """Record a request to dev that got no response in time"""
+        pass
+
+
+class AdaptiveRetryPolicy(RetryPolicy):
+    """Response timeout from a smoothed round trip time estimate (RFC 6298).
+
+    Each (link, device, cmd) keeps SRTT and RTTVAR: a register read and a
+    flash erase on the same device take very different times. The timeout is
+    SRTT + 4 * RTTVAR clamped to [min_timeout, max_timeout], doubled after
+    every timeout until the next sample (still at most max_timeout). Until
+    the first sample the link's own timeout applies. Only first attempts are
+    sampled, as an answer to a resent request can't be told apart from a late
+    answer to the first one.
+    """
+
+    ALPHA = 1.0 / 8
+    BETA = 1.0 / 4
+    K = 4
+    # RFC 6298's 1 s floor is meant for internet paths, a serial or BLE link
+    # answers register reads in milliseconds. Slow commands have estimates of
+    # their own or are executed with an explicit timeout.
+    MIN_TIMEOUT = 0.05
+
+    def __init__(self, retries=3, min_timeout=MIN_TIMEOUT, max_timeout=10.0):
+        super(AdaptiveRetryPolicy, self).__init__(retries)
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self._lock = Lock()
+        self._est = {}  # (link, dev, cmd): [srtt, rttvar, backoff]
+
+    def timeout(self, link, dev, cmd):
+        with self._lock:
+            est = self._est.get((link, dev, cmd))
+            if est is None:
+                return link.timeout
+            srtt, rttvar, backoff = est
+        rto = min(max(srtt + self.K * rttvar, self.min_timeout), self.max_timeout)
+        return min(rto * backoff, self.max_timeout)
+
+    def update(self, link, dev, cmd, rtt):
+        key = (link, dev, cmd)
+        with self._lock:
+            est = self._est.get(key)
+            if est is None:
+                self._est[key] = [rtt, rtt / 2.0, 1]
+                return
+            srtt, rttvar, backoff = est
+            est[1] = (1 - self.BETA) * rttvar + self.BETA * abs(srtt - rtt)
+            est[0] = (1 - self.ALPHA) * srtt + self.ALPHA * rtt
+            est[2] = 1
+
+    def timed_out(self, link, dev, cmd):
+        with self._lock:
+            est = self._est.get((link, dev, cmd))
+            if est is not None:
+                est[2] = min(est[2] * 2, 64)
+
+    def estimate(self, link, dev, cmd):
+        """Return (srtt, rttvar) for cmd requests to dev on link, or None
+        before any sample"""
+        with self._lock:
+            est = self._est.get((link, dev, cmd))
+            return None if est is None else (est[0], est[1])
+
+
+__all__ = ["RetryPolicy", "AdaptiveRetryPolicy"]
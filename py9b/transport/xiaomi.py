@@ -1,8 +1,94 @@
 """Xiaomi packet transport"""
-from struct import pack, unpack
-from .base import checksum, BaseTransport as BT
+from struct import Struct
+from .base import checksum, BaseDecoder, BaseTransport as BT
 from .packet import BasePacket
 
+_MAX_FRAME_SIZE = 0x10A  # 255 bytes of payload plus framing
+
+_HEADER = Struct("<BBBB")  # len, addr, cmd, arg
+_ENC_HEADER = Struct("<BBB")  # addr, cmd, arg
+_LEN = Struct("<B")
+_CHECKSUM = Struct("<H")
+
+
+class XiaomiDecoder(BaseDecoder):
+    """Decoder for both plain (55 AA) and encrypted (55 AB) frames"""
+
+    MAX_DATA = 0xFD  # length byte counts cmd and arg too
+
+    def __init__(self, device=BT.HOST, keys=None, max_data=None, device_max_data=None):
+        super(XiaomiDecoder, self).__init__(max_data, device_max_data)
+        self.device = device
+        self.keys = keys
+
+    def _find_preamble(self, start):
+        buf = self.buf
+        while True:
+            start = buf.find(b"\x55", start)
+            if start < 0 or start + 1 == len(buf) or buf[start + 1] in (0xAA, 0xAB):
+                return start
+            start += 1
+
+    def _data_size(self, start):
+        return self.buf[start + 2] - 2
+
+    def _source(self, start):
+        buf = self.buf
+        if buf[start + 1] == 0xAB:
+            return None  # the address is encrypted
+        try:
+            return self._split_addr(buf[start + 3])[0]
+        except KeyError:
+            return None
+
+    def _frame_size(self, start):
+        # preamble, len, addr, cmd, arg, data, [4 bytes of garbage], checksum
+        buf = self.buf
+        return buf[start + 2] + (10 if buf[start + 1] == 0xAB else 6)
+
+    def _split_addr(self, addr):
+        if self.device == BT.BMS:
+            return XiaomiTransport._BmsAddr2SaDa[addr]
+        else:
+            return XiaomiTransport._BleAddr2SaDa[addr]
+
+    def _parse(self, frame):
+        if frame[1] == 0xAB:
+            # drop 4 bytes of garbage along with the checksum
+            body = self.encrypt(frame[3:-2])
+            addr, cmd, arg = _ENC_HEADER.unpack_from(body)
+            data = bytes(body[3:-4])
+        else:
+            _, addr, cmd, arg = _HEADER.unpack_from(frame, 2)
+            data = frame[6:-2].tobytes()
+        try:
+            sa, da = self._split_addr(addr)
+        except KeyError:
+            return None  # a bus address we have no mapping for, e.g. DEVFF
+        return BasePacket(sa, da, cmd, arg, data)
+
+    @property
+    def keys(self):
+        return self._keys
+
+    @keys.setter
+    def keys(self, keys):
+        if keys is None:
+            self._keys = self._keystream = None
+            return
+        self._keys = bytearray(keys)
+        # keystream as integer for every data length, zero padded past the keys
+        self._keystream = [
+            int.from_bytes(bytes(self._keys[:n]), "little")
+            for n in range(_MAX_FRAME_SIZE + 1)
+        ]
+
+    def encrypt(self, data):
+        size = len(data)
+        ks = self._keystream[min(size, _MAX_FRAME_SIZE)]
+        res = int.from_bytes(bytes(data), "little") ^ ks
+        return bytearray(res.to_bytes(size, "little"))
+
 
 class XiaomiTransport(BT):
     MASTER2ESC = 0x20
@@ -55,72 +141,45 @@ class XiaomiTransport(BT):
         MOTOR: (BT.MOTOR, BT.BMS),
     }
 
-    def __init__(self, link, device=BT.HOST):
-        super(XiaomiTransport, self).__init__(link)
+    def __init__(self, link, device=BT.HOST, max_data=None, device_max_data=None):
+        super(XiaomiTransport, self).__init__(
+            link,
+            XiaomiDecoder(device, max_data=max_data, device_max_data=device_max_data),
+        )
         self.device = device
-        self.keys = None
 
-    def _make_addr(self, src, dst):
-        return XiaomiTransport._SaDa2Addr[src][dst]
+    @property
+    def keys(self):
+        return self.decoder.keys
 
-    def _split_addr(self, addr):
-        if self.device == BT.BMS:
-            return XiaomiTransport._BmsAddr2SaDa[addr]
-        else:
-            return XiaomiTransport._BleAddr2SaDa[addr]
-
-    def _wait_pre(self):
-        while True:
-            while True:
-                c = self.link.read(1)
-                if c == b"\x55":
-                    break
-            while True:
-                c = self.link.read(1)
-                if c == b"\xaa" or c == b"\xab":
-                    return c
-                if c != b"\x55":
-                    break  # start waiting 55 again, else - this is 55, so wait for AA
-
-    def recv(self):
-        ver = self._wait_pre()
-        pkt = self.link.read(1)
-        l = ord(pkt) + 3 + (4 if ver == b"\xab" else 0)
-        for i in range(l):
-            pkt.extend(self.link.read(1))
-        ck_calc = checksum(pkt[0:-2])
-        ck_pkt = unpack("<H", pkt[-2:])[0]
-        if ck_pkt != ck_calc:
-            print("Checksum mismatch !")
-            return None
+    @keys.setter
+    def keys(self, keys):
+        self.decoder.keys = keys
+        self.invalidate_frames()
 
-        if ver == b"\xab":
-            # Drops 2 bytes of garbage and 2 bytes of checksum, first 2 bytes
-            # of garbage are dropped below
-            pkt[1:] = self.encrypt(pkt[1:])[:-4]
-
-        sa, da = self._split_addr(pkt[1])
-        return BasePacket(sa, da, pkt[2], pkt[3], pkt[4:-2])  # sa, da, cmd, arg, data
+    def _make_addr(self, src, dst):
+        return XiaomiTransport._SaDa2Addr[src][dst]
 
-    def send(self, packet):
+    def encode(self, packet):
         dev = self._make_addr(packet.src, packet.dst)
         if self.keys:
-            pkt = pack("<B", len(packet.data) + 2)
+            pkt = _LEN.pack(len(packet.data) + 2)
             pkt += self.encrypt(
-                pack("<BBB", dev, packet.cmd, packet.arg) + packet.data + (b"\x00" * 4)
+                _ENC_HEADER.pack(dev, packet.cmd, packet.arg)
+                + packet.data
+                + (b"\x00" * 4)
             )
-            pkt = b"\x55\xab" + pkt + pack("<H", checksum(pkt))
+            pkt = b"\x55\xab" + pkt + _CHECKSUM.pack(checksum(pkt))
         else:
             pkt = (
-                pack("<BBBB", len(packet.data) + 2, dev, packet.cmd, packet.arg)
+                _HEADER.pack(len(packet.data) + 2, dev, packet.cmd, packet.arg)
                 + packet.data
             )
-            pkt = b"\x55\xaa" + pkt + pack("<H", checksum(pkt))
-        self.link.write(pkt)
+            pkt = b"\x55\xaa" + pkt + _CHECKSUM.pack(checksum(pkt))
+        return pkt
 
     def encrypt(self, data):
-        k = self.keys
-        return bytearray([b ^ (k[i] if i < len(k) else 0) for i, b in enumerate(data)])
+        return self.decoder.encrypt(data)
 
     def recover_keys(self):
         req = BasePacket(src=BT.HOST, dst=BT.BMS, cmd=0x01,
@@ -130,4 +189,4 @@ class XiaomiTransport(BT):
         self.keys += resp.data[9:]
 
 
-__all__ = ["XiaomiTransport"]
+__all__ = ["XiaomiDecoder", "XiaomiTransport"]